@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import argparse
+import urllib.request
+
+# Make the repository modules importable when run as python benchmarks/bench_link_extraction.py
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from bs4 import BeautifulSoup
+from link_extractor import LinkStream, etree, edstem_join_prefix
+
+# Folder holding saved department pages (*.html)
+pages_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+# Chunk size used to simulate a streamed response body
+chunk_size = 64 * 1024
+
+# Downloads department home pages from filtered_berkeley_links.txt into pages_dir
+def fetch_pages(limit):
+    os.makedirs(pages_dir, exist_ok=True)
+    with open(os.path.join(repo_dir, "filtered_berkeley_links.txt"), 'r') as file:
+        urls = [line.strip() for line in file if line.strip()][:limit]
+
+    for index, url in enumerate(urls):
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                content = response.read()
+        except Exception as e:
+            print(f"Failed to fetch {url}: {e}")
+            continue
+
+        with open(os.path.join(pages_dir, f"{index:03d}.html"), 'wb') as file:
+            file.write(content)
+        print(f"Saved {url}")
+
+# Current scrape_page parsing before streaming: full BeautifulSoup tree, then two passes over the <a> tags
+def extract_with_beautifulsoup(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    links = soup.find_all('a', href=True)
+    for link in links:
+        if link['href'].startswith(edstem_join_prefix):
+            return link['href'], []
+    return None, [link['href'] for link in links]
+
+# Streaming extraction, fed in chunks and stopped at the first EdStem join link
+def extract_with_stream(content, use_lxml):
+    link_stream = LinkStream(use_lxml=use_lxml)
+    hrefs = []
+    for start in range(0, len(content), chunk_size):
+        for href in link_stream.feed(content[start:start + chunk_size]):
+            if href.startswith(edstem_join_prefix):
+                return href, []
+            hrefs.append(href)
+    for href in link_stream.close():
+        if href.startswith(edstem_join_prefix):
+            return href, []
+        hrefs.append(href)
+    return None, hrefs
+
+# Times an extractor over every page, returning the total seconds and the results
+def time_extractor(extractor, pages, repeat):
+    results = []
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        results = [extractor(content) for content in pages]
+    return (time.perf_counter() - start_time) / repeat, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scrape_page link extraction on saved department pages")
+    parser.add_argument("--fetch", type=int, default=0, help="download this many department home pages first")
+    parser.add_argument("--repeat", type=int, default=5, help="times to parse every page")
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_pages(args.fetch)
+
+    # Load the saved pages
+    pages = []
+    if os.path.isdir(pages_dir):
+        for file_name in sorted(os.listdir(pages_dir)):
+            if file_name.endswith(".html"):
+                with open(os.path.join(pages_dir, file_name), 'rb') as file:
+                    pages.append(file.read())
+    if not pages:
+        print(f"No saved pages in {pages_dir}, run with --fetch N to download some")
+        return
+
+    print(f"Parsing {len(pages)} pages ({sum(len(page) for page in pages) / 1024:.0f} KB), {args.repeat} repeats")
+
+    extractors = [("BeautifulSoup html.parser", extract_with_beautifulsoup)]
+    extractors.append(("Streaming html.parser", lambda content: extract_with_stream(content, use_lxml=False)))
+    if etree is not None:
+        extractors.append(("Streaming lxml", lambda content: extract_with_stream(content, use_lxml=True)))
+
+    baseline_seconds, baseline_results = time_extractor(extractors[0][1], pages, args.repeat)
+    for name, extractor in extractors:
+        seconds, results = time_extractor(extractor, pages, args.repeat)
+
+        # The streaming extractors must find the same EdStem links and internal hrefs
+        matches = sum(1 for result, baseline_result in zip(results, baseline_results) if result == baseline_result)
+        print(f"{name:<28} {seconds * 1000 / len(pages):8.2f} ms/page  {baseline_seconds / seconds:6.2f}x  {matches}/{len(pages)} pages match")
+
+if __name__ == "__main__":
+    main()
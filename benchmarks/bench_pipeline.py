@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the repository modules importable when run as python benchmarks/bench_pipeline.py
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from offline_server import OfflineSite, OfflineServer, FakeGradioClient, load_fixture_posts
+from instrumentation import metrics, percentile
+from link_index import canonical_edstem_link
+
+# Stages that can be benchmarked (selenium stages need Chrome and chromedriver)
+all_stages = ["post_fetcher", "post_llm", "post_image_llm", "pipeline", "post_scraper", "thread_scraper", "crawl"]
+default_stages = ["post_fetcher", "post_llm", "post_image_llm", "pipeline", "crawl"]
+
+# Report keys compared between versions, and whether a higher value is better
+compared_keys = {"throughput": True, "p50": False, "p95": False}
+
+# Same post_dict shape post_scraper and post_fetcher return
+def fixture_post_dict(post):
+    return {
+        "post_link": [canonical_edstem_link(post['course_id'], post['thread_id'])],
+        "title": [post['title']],
+        "date_posted": [post['date_posted']],
+        "posted_by": [post['posted_by']],
+        "description": [post['description']],
+        "image_url": [None]
+    }
+
+# Runs one stage and reports items/sec, per-item latency and the instrumentation collected during it
+def measure(name, unit, run):
+    metrics.reset()
+    start_time = time.perf_counter()
+    latencies = run()
+    elapsed = time.perf_counter() - start_time
+
+    latencies = sorted(latencies)
+    report = {
+        "unit": unit,
+        "items": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "stages": metrics.stage_stats(),
+        "counters": dict(metrics.counters)
+    }
+    print(f"{name:<16}{report['items']:>6} {unit:<12}{report['throughput']:>10.2f} {unit}/s  p50 {report['p50'] * 1000:>8.1f} ms  p95 {report['p95'] * 1000:>8.1f} ms")
+    return report
+
+# Calls function on every item from a thread pool, returning each call's latency
+def timed_map(function, items, workers):
+    def call(item):
+        start_time = time.perf_counter()
+        function(item)
+        return time.perf_counter() - start_time
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, items))
+
+# post_fetcher over one pooled requests session (the pipeline's fast scrape path)
+def bench_post_fetcher(server, posts, args):
+    import edstem_api
+    from edstem_api import post_fetcher
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    edstem_api.edstem_api_url = f"{server.url}/api"
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=args.workers, pool_maxsize=args.workers))
+    links = [canonical_edstem_link(post['course_id'], post['thread_id']) for post in posts]
+    return measure("post_fetcher", "posts", lambda: timed_map(lambda link: post_fetcher(session, link), links, args.workers))
+
+# post_llm (batch size 1) or post_llm_batch against the fake OpenAI endpoint
+def bench_post_llm(server, posts, args):
+    from functions import post_llm, post_llm_batch
+
+    post_dicts = [fixture_post_dict(post) for post in posts]
+    if args.batch_size <= 1:
+        return measure("post_llm", "posts", lambda: timed_map(lambda post_dict: post_llm("offline", post_dict), post_dicts, args.llm_workers))
+
+    # Every post in a batch waits for the whole batch
+    batches = [post_dicts[start:start + args.batch_size] for start in range(0, len(post_dicts), args.batch_size)]
+    def run():
+        latencies = []
+        def call(batch):
+            start_time = time.perf_counter()
+            post_llm_batch("offline", batch)
+            return [time.perf_counter() - start_time] * len(batch)
+        with ThreadPoolExecutor(max_workers=args.llm_workers) as executor:
+            for batch_latencies in executor.map(call, batches):
+                latencies += batch_latencies
+        return latencies
+    return measure("post_llm_batch", "posts", run)
+
+# Points post_image_llm at the gradio stand-in (the stand-in takes plain paths, so gradio_client is never imported)
+def use_fake_gradio(server, args):
+    import functions
+
+    gradio_client = FakeGradioClient(server.httpd.site, upload_latency=args.gradio_upload_latency, respond_latency=args.gradio_latency)
+    functions.get_gradio_client = lambda hf_token: gradio_client
+    functions.gradio_file = lambda image_path: image_path
+
+# Replaces the shared OpenAI and Hugging Face schedulers with the benchmark's own limits (0 for no limit), so the results
+# measure the code rather than the production quotas
+def use_benchmark_schedulers(args):
+    import functions
+    from rate_limiter import RequestScheduler
+
+    functions.openai_scheduler = RequestScheduler("openai", requests_per_minute=args.openai_rpm or None, tokens_per_minute=args.openai_tpm or None,
+                                                  initial_concurrency=args.llm_workers, max_concurrency=args.llm_workers)
+    functions.hf_scheduler = RequestScheduler("huggingface", requests_per_minute=args.hf_rpm or None,
+                                              initial_concurrency=args.vision_workers, max_concurrency=args.vision_workers)
+
+# Formats one of the benchmark's scheduler limits for the results header
+def describe_limit(value, unit):
+    return f"{value} {unit}" if value else f"no {unit} limit"
+
+# post_image_llm against the gradio stand-in
+def bench_post_image_llm(server, posts, args):
+    import functions
+
+    use_fake_gradio(server, args)
+    post_texts = [(json.dumps(functions.post_llm_context(fixture_post_dict(post)), ensure_ascii=False), f"{server.url}/images/{post['thread_id']}.png") for post in posts]
+    return measure("post_image_llm", "posts", lambda: timed_map(lambda item: functions.post_image_llm("offline", *item), post_texts, args.vision_workers))
+
+# run_pipeline end to end: API fetch, LLM, optional vision and database writes into a throwaway event store
+def bench_pipeline(server, posts, args):
+    import edstem_api
+    import requests
+    from requests.adapters import HTTPAdapter
+    from pipeline import run_pipeline
+    from event_store import EventStore
+    from work_queue import WorkQueue
+
+    edstem_api.edstem_api_url = f"{server.url}/api"
+    use_fake_gradio(server, args)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        store = EventStore(os.path.join(temporary_dir, "events.db"))
+        work_queue = WorkQueue(store)
+        work_queue.enqueue([canonical_edstem_link(post['course_id'], post['thread_id']) for post in posts])
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=args.workers, pool_maxsize=args.workers))
+
+        # Each post's latency is from the start of the run until it is stored
+        def run():
+            start_time = time.perf_counter()
+            stored_at = []
+            complete = work_queue.complete
+            def timed_complete(post_llm_dict_list):
+                stored = complete(post_llm_dict_list)
+                stored_at.extend([time.perf_counter() - start_time] * len(post_llm_dict_list))
+                return stored
+            work_queue.complete = timed_complete
+
+            # No drivers: every post comes from the API, which the offline server answers
+            run_pipeline([], "offline", work_queue, session=session, scrape_workers=args.workers, llm_workers=args.llm_workers,
+                         llm_batch_size=args.batch_size, llm_batch_wait=args.batch_wait,
+                         hf_token="offline" if args.vision else None, vision_workers=args.vision_workers)
+            return stored_at
+
+        report = measure("pipeline", "posts", run)
+        store.close()
+    return report
+
+# post_scraper through a pool of headless drivers
+def bench_post_scraper(server, posts, args):
+    from functions import create_driver, post_scraper
+
+    drivers = [create_driver(headless=True) for _ in range(args.drivers)]
+    driver_queue = Queue()
+    for driver in drivers:
+        driver_queue.put(driver)
+
+    def scrape(post):
+        driver = driver_queue.get()
+        try:
+            post_scraper(driver, server.post_url(post))
+        finally:
+            driver_queue.put(driver)
+
+    try:
+        return measure("post_scraper", "posts", lambda: timed_map(scrape, posts, args.drivers))
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+# dept_edstem_thread_scraper over every recorded course's thread (full scroll, not incremental)
+def bench_thread_scraper(server, posts, args):
+    from functions import create_driver, dept_edstem_thread_scraper
+
+    course_ids = sorted({post['course_id'] for post in posts})
+    thread_dict_list = [{"Department Name": f"Course {course_id}", "Thread Name": "Events", "Thread Link": server.thread_url(course_id)} for course_id in course_ids]
+    driver = create_driver(headless=True)
+
+    def run():
+        latencies = []
+        for thread_dict in thread_dict_list:
+            start_time = time.perf_counter()
+            dept_edstem_thread_scraper(driver, thread_dict, incremental=False, new_post_links_file=None)
+            latencies.append(time.perf_counter() - start_time)
+        return latencies
+
+    try:
+        return measure("thread_scraper", "threads", run)
+    finally:
+        driver.quit()
+
+# crawl_department over the synthetic department sites (all on one local host, so the per-host interval is lowered)
+def bench_crawl(server, posts, args):
+    import department_scraper
+
+    department_scraper.host_limiter = department_scraper.HostLimiter(min_interval=args.host_interval)
+    department_scraper.visited_urls = department_scraper.VisitedSet()
+    department_urls = server.httpd.site.department_urls(server.url)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        department_scraper.edstem_links_file = os.path.join(temporary_dir, "edstem_links.txt")
+
+        def run():
+            latencies = []
+            async def crawl_all():
+                async with department_scraper.create_session() as session:
+                    async def crawl(department_url):
+                        start_time = time.perf_counter()
+                        await department_scraper.crawl_department(session, department_url)
+                        latencies.append(time.perf_counter() - start_time)
+                    await asyncio.gather(*(crawl(department_url) for department_url in department_urls))
+            asyncio.run(crawl_all())
+            return latencies
+
+        return measure("crawl", "departments", run)
+
+stage_benchmarks = {
+    "post_fetcher": bench_post_fetcher,
+    "post_llm": bench_post_llm,
+    "post_image_llm": bench_post_image_llm,
+    "pipeline": bench_pipeline,
+    "post_scraper": bench_post_scraper,
+    "thread_scraper": bench_thread_scraper,
+    "crawl": bench_crawl
+}
+
+# Short description of the checked out version
+def current_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Compares a run against a saved baseline, returning the regressions beyond tolerance
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"Compared with {baseline['version']}:")
+    for stage, report in results['stages'].items():
+        baseline_report = baseline['stages'].get(stage)
+        if baseline_report is None:
+            continue
+        for key, higher_is_better in compared_keys.items():
+            old, new = baseline_report[key], report[key]
+            if not old:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            print(f"  {stage:<16}{key:<12}{old:>12.4f} -> {new:<12.4f}{change:+8.1%}{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((stage, key, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scraping and classification offline against recorded EdStem pages and a local LLM stand-in")
+    parser.add_argument("--stages", nargs="+", choices=all_stages, default=default_stages, help="post_scraper and thread_scraper need Chrome")
+    parser.add_argument("--posts", type=int, default=200, help="recorded posts to replay (0 for all)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent API fetches")
+    parser.add_argument("--drivers", type=int, default=2, help="headless drivers for post_scraper")
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=10, help="posts per LLM request (1 calls post_llm)")
+    parser.add_argument("--batch-wait", type=float, default=0.5)
+    parser.add_argument("--vision", action="store_true", help="include the vision stage in the pipeline benchmark")
+    parser.add_argument("--vision-workers", type=int, default=2)
+    parser.add_argument("--page-latency", type=float, default=0.05, help="seconds before every page and API response")
+    parser.add_argument("--scroll-latency", type=float, default=0.3, help="seconds before a thread's next rows appear")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per LLM request")
+    parser.add_argument("--llm-latency-per-post", type=float, default=0.05, help="extra seconds per post in an LLM request")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of invalid LLM answers")
+    parser.add_argument("--gradio-latency", type=float, default=1.5, help="seconds per vision model answer")
+    parser.add_argument("--gradio-upload-latency", type=float, default=0.2)
+    parser.add_argument("--openai-rpm", type=int, default=0, help="OpenAI requests per minute during the benchmark (0 for no limit)")
+    parser.add_argument("--openai-tpm", type=int, default=0, help="OpenAI tokens per minute during the benchmark (0 for no limit)")
+    parser.add_argument("--hf-rpm", type=int, default=0, help="Hugging Face requests per minute during the benchmark (0 for no limit)")
+    parser.add_argument("--departments", type=int, default=20)
+    parser.add_argument("--host-interval", type=float, default=0.0, help="per-host request interval for the crawl")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="results JSON of a previous version to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    use_benchmark_schedulers(args)
+
+    posts = load_fixture_posts(args.posts or None)
+    site = OfflineSite(posts, page_latency=args.page_latency, scroll_latency=args.scroll_latency, llm_latency=args.llm_latency,
+                       llm_latency_per_post=args.llm_latency_per_post, invalid_rate=args.invalid_rate, departments=args.departments)
+
+    results = {"version": current_version(), "settings": vars(args), "stages": {}}
+    with OfflineServer(site) as server:
+        # The OpenAI client reads its base URL from the environment when it is created
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        print(f"Replaying {len(posts)} recorded posts from {server.url}")
+        print(f"Scheduler limits: OpenAI {describe_limit(args.openai_rpm, 'requests/min')}, {describe_limit(args.openai_tpm, 'tokens/min')}, "
+              f"{args.llm_workers} concurrent; Hugging Face {describe_limit(args.hf_rpm, 'requests/min')}, {args.vision_workers} concurrent")
+
+        for stage in args.stages:
+            results['stages'][stage] = stage_benchmarks[stage](server, posts, args)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
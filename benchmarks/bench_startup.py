@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Make the repository modules importable when run as python benchmarks/bench_startup.py
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from instrumentation import percentile
+from bench_pipeline import compare, current_version
+
+# Modules whose import is timed on its own (a missing optional dependency is reported, not fatal)
+default_modules = ["main", "cli", "event_store", "event_query", "work_queue", "llm_cache", "department_scraper", "functions", "pipeline"]
+
+# Heavy dependencies that quick commands should never load
+heavy_modules = ["selenium", "openai", "gradio_client", "pandas", "sklearn", "aiohttp"]
+
+# Runs a fresh interpreter with the given arguments, returning (wall time, stderr, return code)
+def run_python(arguments, cwd):
+    start_time = time.perf_counter()
+    completed = subprocess.run([sys.executable, *arguments], cwd=cwd, capture_output=True, text=True)
+    return time.perf_counter() - start_time, completed.stderr, completed.returncode
+
+# Times a command over several fresh interpreters, like bench_pipeline.measure but per process start
+def measure(name, arguments, cwd, repeats):
+    latencies = []
+    for _ in range(repeats):
+        elapsed, stderr, returncode = run_python(arguments, cwd)
+        if returncode != 0:
+            print(f"{name:<28}failed: {stderr.strip().splitlines()[-1] if stderr.strip() else returncode}")
+            return None
+        latencies.append(elapsed)
+
+    latencies.sort()
+    report = {
+        "unit": "runs",
+        "items": len(latencies),
+        "elapsed": sum(latencies),
+        "throughput": len(latencies) / sum(latencies),
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95)
+    }
+    print(f"{name:<28}p50 {report['p50'] * 1000:>8.1f} ms  p95 {report['p95'] * 1000:>8.1f} ms")
+    return report
+
+# Modules a command imports (indented when nested) and their cumulative import time in microseconds, from python -X importtime
+def import_profile(arguments, cwd):
+    _, stderr, _ = run_python(["-X", "importtime", *arguments], cwd)
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, module = line.split("|")
+        # Nested imports are indented by two spaces per level
+        cumulative[module[1:].rstrip()] = int(cumulative_us)
+    return cumulative
+
+# Prints the slowest top-level imports of a command and warns about heavy dependencies it loaded
+def report_imports(name, arguments, cwd, top):
+    cumulative = import_profile(arguments, cwd)
+    loaded_heavy = [module for module in heavy_modules if any(imported.strip() == module for imported in cumulative)]
+    top_level = sorted(((us, module) for module, us in cumulative.items() if not module.startswith(" ")), reverse=True)[:top]
+    print(f"{name}: slowest imports" + (f" (loads {', '.join(loaded_heavy)})" if loaded_heavy else ""))
+    for us, module in top_level:
+        print(f"  {module:<32}{us / 1000:>8.1f} ms")
+    return loaded_heavy
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark how fast the command line and the main modules start")
+    parser.add_argument("--repeats", type=int, default=10, help="fresh interpreters per command")
+    parser.add_argument("--modules", nargs="+", default=default_modules, help="modules to time on their own")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports shown per command")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds a quick command may take (p95)")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="results JSON of a previous version to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    # stats runs against a copy of the CSV databases so the benchmark does not touch the real event store
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    for csv_name in ("events_database.csv", "rejected_database.csv", "threads_database.csv"):
+        if os.path.exists(os.path.join(repo_dir, csv_name)):
+            shutil.copy(os.path.join(repo_dir, csv_name), work_dir)
+    cli_path = os.path.join(repo_dir, "cli.py")
+
+    # Import the CSVs into the copy once (stats only reads), so every timed run sees the steady state a cron job sees
+    migrate = f"import sys; sys.path.insert(0, {repo_dir!r}); from event_store import EventStore; store = EventStore(); store.migrate_from_csv(); store.close()"
+    run_python(["-c", migrate], work_dir)
+
+    commands = {
+        "python": ["-c", "pass"],
+        "cli --help": [cli_path, "--help"],
+        "cli stats": [cli_path, "stats"]
+    }
+    for module in args.modules:
+        commands[f"import {module}"] = ["-c", f"import sys; sys.path.insert(0, {repo_dir!r}); import {module}"]
+
+    results = {"version": current_version(), "settings": vars(args), "stages": {}}
+    print(f"Startup times over {args.repeats} fresh interpreters:")
+    for name, arguments in commands.items():
+        report = measure(name, arguments, work_dir, args.repeats)
+        if report is not None:
+            results['stages'][name] = report
+
+    # Quick commands must stay within the budget and must not load the browser or LLM clients
+    over_budget = False
+    for name in ("cli --help", "cli stats"):
+        print()
+        if report_imports(name, commands[name], work_dir, args.top):
+            over_budget = True
+        report = results['stages'].get(name)
+        if report is not None and report['p95'] > args.budget:
+            print(f"{name} took {report['p95']:.2f}s (p95), over the {args.budget:g}s budget")
+            over_budget = True
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+        print(f"Results saved to {args.output}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+
+    if over_budget or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import html
+import random
+import tempfile
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Make the repository modules importable when run from the benchmarks folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from event_store import EventStore
+from link_index import parse_edstem_link, canonical_edstem_link
+from link_extractor import edstem_join_prefix
+
+# Allowed answers (kept in sync with functions.py, which is not imported here so the server runs without selenium/openai)
+event_types = ["Meeting", "Workshop", "Seminar", "Lecture", "Social", "Fair"]
+is_food_answers = ["TRUE", "FALSE", "LIKELY"]
+
+# Smallest valid PNG, served for every poster image
+poster_png = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+# Answer the fake LLMs give for posts that are not in the fixtures
+non_event_answer = {
+    "is_event": False, "event_type": None, "event_date": None, "event_time": None,
+    "event_location": None, "is_food": "FALSE", "food_type": None
+}
+
+# Turns a stored post's labels into an answer that passes validate_post_llm_answer
+def canned_answer(row):
+    if not row['is_event']:
+        return dict(non_event_answer)
+
+    event_date = row['event_date']
+    try:
+        event_date = datetime.strptime(event_date, "%d-%b-%Y").strftime("%d-%b-%Y")
+    except (TypeError, ValueError):
+        event_date = None
+
+    event_time = (row['event_time'] or "").upper()
+    try:
+        event_time = datetime.strptime(event_time, "%I:%M %p").strftime("%I:%M %p")
+    except ValueError:
+        event_time = None
+
+    is_food = (row['is_food'] or "").upper()
+    return {
+        "is_event": True,
+        "event_type": row['event_type'] if row['event_type'] in event_types else None,
+        "event_date": event_date,
+        "event_time": event_time,
+        "event_location": row['event_location'] if row['event_location'] not in (None, "", "Not Specified") else None,
+        "is_food": is_food if is_food in is_food_answers else "FALSE",
+        "food_type": row['food_type']
+    }
+
+# Loads the recorded posts from events_database.csv and rejected_database.csv (through a throwaway event store)
+def load_fixture_posts(limit=None):
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        store = EventStore(os.path.join(temporary_dir, "fixtures.db"))
+        store.migrate_from_csv(os.path.join(repo_dir, "events_database.csv"), os.path.join(repo_dir, "rejected_database.csv"))
+        rows = store.posts()
+        store.close()
+
+    posts = []
+    for row in rows:
+        try:
+            course_id, thread_id = parse_edstem_link(row['post_link'])
+        except ValueError:
+            continue
+        row['course_id'] = course_id
+        row['thread_id'] = thread_id
+        row['answer'] = canned_answer(row)
+        posts.append(row)
+
+    posts.sort(key=lambda post: post['thread_id'], reverse=True)
+    return posts[:limit] if limit else posts
+
+# Recorded EdStem threads, posts and department sites, plus the fake OpenAI endpoint
+class OfflineSite:
+    def __init__(self, posts, page_latency=0.0, scroll_latency=0.3, llm_latency=0.5, llm_latency_per_post=0.05,
+                 invalid_rate=0.0, departments=20, fanout=4, department_depth=3, page_bytes=30 * 1024, seed=0):
+        self.posts = posts
+        self.posts_by_id = {post['thread_id']: post for post in posts}
+        self.answers_by_title = {post['title']: post['answer'] for post in posts}
+        self.page_latency = page_latency  # Seconds before every page or API response
+        self.scroll_latency = scroll_latency  # Seconds before a thread's next page of rows appears
+        self.llm_latency = llm_latency  # Seconds per LLM request...
+        self.llm_latency_per_post = llm_latency_per_post  # ...plus seconds per post in it
+        self.invalid_rate = invalid_rate  # Share of LLM answers that are invalid (exercises the retry path)
+        self.departments = departments
+        self.fanout = fanout
+        self.department_depth = department_depth
+        self.page_bytes = page_bytes
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+        # Posts grouped by course, newest first like the EdStem list
+        self.courses = {}
+        for post in posts:
+            self.courses.setdefault(post['course_id'], []).append(post)
+
+    # Answer for a post, looked up by the title in the LLM context
+    def answer_for(self, context):
+        answer = dict(self.answers_by_title.get(context.get('title'), non_event_answer))
+        with self.random_lock:
+            invalid = self.random.random() < self.invalid_rate
+        if invalid:
+            answer['event_time'] = "around noon"
+            answer['is_event'] = True
+        return answer
+
+    # A thread's list page: rows appear a page at a time after each scroll, like EdStem's lazy loading
+    def thread_page(self, course_id):
+        links = [canonical_edstem_link(post['course_id'], post['thread_id']) for post in self.courses.get(course_id, [])]
+        return f"""<!DOCTYPE html>
+<html><head><title>Course {course_id}</title></head>
+<body>
+<div class="dlr-list" style="height: 600px; overflow-y: scroll;"></div>
+<script>
+const links = {json.dumps(links)};
+const pageSize = 30;
+const scrollLatency = {int(self.scroll_latency * 1000)};
+const list = document.querySelector('.dlr-list');
+let loaded = 0;
+let loading = false;
+function loadPage() {{
+    for (const link of links.slice(loaded, loaded + pageSize)) {{
+        const item = document.createElement('div');
+        item.className = 'dlv-item';
+        item.style.height = '48px';
+        const anchor = document.createElement('a');
+        anchor.href = link;
+        anchor.textContent = link;
+        item.appendChild(anchor);
+        list.appendChild(item);
+    }}
+    loaded = Math.min(loaded + pageSize, links.length);
+    loading = false;
+}}
+list.addEventListener('scroll', () => {{
+    if (loading || loaded >= links.length) return;
+    if (list.scrollTop + list.clientHeight >= list.scrollHeight - 50) {{
+        loading = true;
+        setTimeout(loadPage, scrollLatency);
+    }}
+}});
+loadPage();
+</script>
+</body></html>"""
+
+    # A post page with the elements post_scraper reads
+    def post_page(self, base_url, post):
+        created_at = post['date_posted'] or "2024-01-01T00:00:00.000000Z"
+        created_at = created_at[:23] + "Z" if len(created_at) > 23 else created_at
+        description = html.escape(post['description'] or "").replace("\n", "<br>")
+        return f"""<!DOCTYPE html>
+<html><head><title>{html.escape(post['title'] or "")}</title></head>
+<body>
+<div class="discuss-thread-base">
+    <h1 class="disthrb-title">{html.escape(post['title'] or "")}</h1>
+    <div class="disthrb-user-name">{html.escape(post['posted_by'] or "")}</div>
+    <div class="disthrb-date"><time datetime="{created_at}">{created_at}</time></div>
+    <div class="amber-display-document">{description}</div>
+    <div class="imgl-inner"><img src="{base_url}/images/{post['thread_id']}.png"></div>
+</div>
+</body></html>"""
+
+    # The EdStem API's JSON for a thread, as read by post_fetcher
+    def thread_json(self, base_url, post):
+        created_at = post['date_posted'] or "2024-01-01T00:00:00.000000Z"
+        return {
+            "thread": {
+                "id": post['thread_id'],
+                "course_id": post['course_id'],
+                "title": post['title'],
+                "created_at": created_at.replace("Z", "+00:00"),
+                "user_id": 1,
+                "document": post['description'],
+                "content": f'<document><image src="{base_url}/images/{post["thread_id"]}.png"/></document>'
+            },
+            "users": [{"id": 1, "name": post['posted_by']}]
+        }
+
+    # Depth of a department page (pages are numbered breadth first, page 0 is the home page)
+    def department_page_depth(self, page):
+        depth = 0
+        while page > 0:
+            page = (page - 1) // self.fanout
+            depth += 1
+        return depth
+
+    # A department site page: links to child pages, a PDF and an off-site page, with the EdStem join link on the last
+    # page of the deepest level (every fourth department has none, so it is crawled to its page budget)
+    def department_page(self, department, page):
+        depth = self.department_page_depth(page)
+        links = []
+        if depth < self.department_depth:
+            links += [f"/departments/{department}/{child}" for child in range(page * self.fanout + 1, page * self.fanout + self.fanout + 1)]
+        links.append(f"/departments/{department}/{page}.pdf")
+        links.append("https://www.berkeley.edu/")
+
+        last_page = sum(self.fanout ** level for level in range(self.department_depth + 1)) - 1
+        if department % 4 != 0 and page == last_page:
+            links.append(f"{edstem_join_prefix}offline{department}")
+
+        anchors = "\n".join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+        filler = "<p>" + "Department news and announcements. " * max(1, self.page_bytes // 35) + "</p>"
+        return f"""<!DOCTYPE html>
+<html><head><title>Department {department} page {page}</title></head>
+<body><nav><ul>
+{anchors}
+</ul></nav>
+{filler}
+</body></html>"""
+
+    # Department home page URLs
+    def department_urls(self, base_url):
+        return [f"{base_url}/departments/{department}/0" for department in range(self.departments)]
+
+    # Fake chat completion for post_llm_batch's request (post IDs and contexts are read back out of the prompt)
+    def chat_completion(self, request):
+        prompt = request['messages'][-1]['content']
+        start = prompt.index("{", prompt.index("keyed by post ID"))
+        end = prompt.index("Questions to Answer")
+        pending_posts = json.loads(prompt[start:end].strip())
+
+        time.sleep(self.llm_latency + self.llm_latency_per_post * len(pending_posts))
+
+        answers = [{"id": post_id, **self.answer_for(context)} for post_id, context in pending_posts.items()]
+        content = json.dumps({"posts": answers})
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-offline-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', "offline"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop", "logprobs": None}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+# Routes requests to the offline site
+class OfflineRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, content_type, body):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.server.site
+        base_url = self.server.url
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        time.sleep(site.page_latency)
+
+        try:
+            # /us/courses/<course_id>/discussion/ and /us/courses/<course_id>/discussion/<thread_id>
+            if parts[:2] == ["us", "courses"] and len(parts) >= 4 and parts[3] == "discussion":
+                if len(parts) == 4:
+                    return self.send_body(200, "text/html; charset=utf-8", site.thread_page(int(parts[2])))
+                post = site.posts_by_id.get(int(parts[4]))
+                if post is not None:
+                    return self.send_body(200, "text/html; charset=utf-8", site.post_page(base_url, post))
+
+            # /api/threads/<thread_id>
+            elif parts[:2] == ["api", "threads"] and len(parts) == 3:
+                post = site.posts_by_id.get(int(parts[2]))
+                if post is not None:
+                    return self.send_body(200, "application/json", json.dumps(site.thread_json(base_url, post)))
+
+            # /images/<thread_id>.png
+            elif parts[:1] == ["images"]:
+                return self.send_body(200, "image/png", poster_png)
+
+            # /departments/<department>/<page> and /departments/<department>/<page>.pdf
+            elif parts[:1] == ["departments"] and len(parts) == 3:
+                if parts[2].endswith(".pdf"):
+                    return self.send_body(200, "application/pdf", b"%PDF-1.4\n" + b"0" * 1024)
+                return self.send_body(200, "text/html; charset=utf-8", site.department_page(int(parts[1]), int(parts[2])))
+        except ValueError:
+            pass
+
+        self.send_body(404, "text/plain", "Not found")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        # OpenAI-compatible chat completions endpoint (OPENAI_BASE_URL=<server>/v1)
+        if urlparse(self.path).path.rstrip("/") == "/v1/chat/completions":
+            return self.send_body(200, "application/json", json.dumps(self.server.site.chat_completion(request)))
+
+        self.send_body(404, "application/json", json.dumps({"error": {"message": "Not found"}}))
+
+# Serves an OfflineSite from a background thread on a free local port
+class OfflineServer:
+    def __init__(self, site, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), OfflineRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.site = site
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.httpd.url = self.url
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Local URL of a post (the canonical EdStem link with the server as host)
+    def post_url(self, post):
+        return f"{self.url}/us/courses/{post['course_id']}/discussion/{post['thread_id']}"
+
+    # Local URL of a course's thread list
+    def thread_url(self, course_id):
+        return f"{self.url}/us/courses/{course_id}/discussion/?category=Events"
+
+# Stand-in for the gradio_client Client of the MiniCPM space, answering from the fixtures after a fixed latency
+class FakeGradioClient:
+    def __init__(self, site, upload_latency=0.2, respond_latency=1.5):
+        self.site = site
+        self.upload_latency = upload_latency
+        self.respond_latency = respond_latency
+
+    def predict(self, *args, api_name=None, **kwargs):
+        if api_name == "/upload_img":
+            time.sleep(self.upload_latency)
+            return []
+
+        # The post context is the JSON object after "Additional Context:" in the question
+        question = kwargs['_chat_bot'][0][0]
+        start = question.index("{", question.index("Additional Context:"))
+        end = question.index("Questions to Answer")
+        context = json.loads(question[start:end].strip())
+
+        time.sleep(self.respond_latency)
+        return [[question, json.dumps(self.site.answer_for(context))]]
@@ -0,0 +1,106 @@
+import argparse
+import os
+
+# Command line entry point, e.g. python cli.py process-posts
+# Settings (credentials, worker counts, feature switches) are read from main.py
+# Each subcommand imports only what it needs, so quick runs (stats, cron-triggered crawls) do not load Selenium, OpenAI or gradio
+
+# Crawls the department websites for EdStem join links (aiohttp only, no browser)
+def crawl_departments_command(args):
+    from department_scraper import main as crawl_main
+    crawl_main()
+
+# Logs in and scrapes the department threads for new post links (added to new_post_links.txt)
+def scrape_threads_command(args):
+    import main
+    from instrumentation import metrics
+
+    store, link_index = main.open_store()
+    driver = main.login()
+    try:
+        main.scrape_threads_step(driver, link_index, max_workers=args.workers)
+    finally:
+        driver.quit()
+        link_index.save()
+        store.close()
+
+    metrics.summary()
+    metrics.write_trace("scrape_trace.json")
+
+# Logs in and scrapes, classifies and stores every pending post link
+def process_posts_command(args):
+    import main
+    from llm_cache import LLMCache
+
+    llm_cache = LLMCache("llm_cache.db")
+    store, link_index = main.open_store()
+    driver = main.login()
+    try:
+        if args.scrape_threads:
+            main.scrape_threads_step(driver, link_index)
+        work_queue = main.fill_work_queue(store, link_index, requeue_failed=args.requeue_failed or None)
+        main.process_posts(driver, store, work_queue, llm_cache, pipeline=False if args.serial else None)
+        main.report(llm_cache, work_queue)
+    finally:
+        driver.quit()
+        llm_cache.close()
+        store.close()
+
+# Prints what is stored, queued and cached, and the food events coming up
+# Does not import the CSVs, create missing databases or evict cache entries (process-posts does that)
+def stats_command(args):
+    from event_store import EventStore
+    from work_queue import WorkQueue
+    from llm_cache import count_cache_entries
+    from event_query import EventIndex
+
+    if not os.path.exists(args.database):
+        print(f"No event database at {args.database} yet (process-posts creates it)")
+        return
+
+    store = EventStore(args.database)
+    try:
+        print(f"Events: {store.count(is_event=True)}")
+        print(f"Rejected: {store.count(is_event=False)}")
+        print(f"Linked Duplicates: {store.count(include_duplicates=True) - store.count()}")
+        has_work_queue = store.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'link_queue'").fetchone()
+        if has_work_queue:
+            print(f"Work Queue: {WorkQueue(store).counts()}")
+
+        print(f"LLM Cache Entries: {count_cache_entries(args.cache)}")
+
+        food_events = EventIndex(store).food_events(args.hours, include_likely=True)
+        print(f"Food Events in the Next {args.hours:g} Hours: {len(food_events)}")
+    finally:
+        store.close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Find free food events posted on EdStem")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = subparsers.add_parser("crawl-departments", help="crawl department websites for EdStem links")
+    crawl_parser.set_defaults(handler=crawl_departments_command)
+
+    scrape_parser = subparsers.add_parser("scrape-threads", help="scrape department threads for new post links")
+    scrape_parser.add_argument("--workers", type=int, default=None, help="threads scraped at once (default from main.py)")
+    scrape_parser.set_defaults(handler=scrape_threads_command)
+
+    process_parser = subparsers.add_parser("process-posts", help="scrape, classify and store pending posts")
+    process_parser.add_argument("--scrape-threads", action="store_true", help="scrape the department threads first")
+    process_parser.add_argument("--requeue-failed", action="store_true", help="retry links that failed too many times")
+    process_parser.add_argument("--serial", action="store_true", help="process one link at a time instead of the pipeline")
+    process_parser.set_defaults(handler=process_posts_command)
+
+    stats_parser = subparsers.add_parser("stats", help="show stored events, queue and cache state")
+    stats_parser.add_argument("--hours", type=float, default=24, help="how far ahead to count food events")
+    stats_parser.add_argument("--database", default="events.db")
+    stats_parser.add_argument("--cache", default="llm_cache.db")
+    stats_parser.set_defaults(handler=stats_command)
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,112 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from functions import *
+from link_extractor import LinkStream, extract_links, edstem_join_prefix
+from instrumentation import metrics
+import asyncio
+import aiohttp
+import time
 
-# List of UC Berkeley department URLs to search
-# department_urls = department_scraper()
-department_urls = ['https://econ.berkeley.edu/', 'https://www.stat.berkeley.edu/']  # For testing
-
-# Set of visited URLs to avoid duplicates
-visited_urls = set()
+# Spoof a browser User-Agent
+headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
 
 # File to save EdStem links
 edstem_links_file = 'edstem_links.txt'
 
-# Lock to prevent race conditions when writing to a file in parallel
-from threading import Lock
-file_lock = Lock()
+# File with the department URLs found by department_scraper()
+department_links_file = 'filtered_berkeley_links.txt'
+
+# Crawl budgets and politeness settings
+max_depth = 3  # How many links deep to follow from a department's home page
+max_pages = 200  # Most pages fetched per department
+department_workers = 100  # Departments crawled at the same time
+max_connections = 300  # Connections open at the same time across all hosts
+per_host_concurrency = 4  # Requests in flight to one host at the same time
+per_host_interval = 0.25  # Seconds between starting requests to the same host
+request_timeout = 10  # Seconds before a request is abandoned
+max_page_bytes = 5 * 1024 * 1024  # Most bytes read from one page
+
+# Normalizes a URL so the same page is only visited once (lowercase host, no fragment, default port, sorted query)
+def normalize_url(url):
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parsed.path or "/"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, netloc, path, parsed.params, query, ""))
+
+# Set of normalized URLs that have already been queued (only touched from the event loop thread)
+class VisitedSet:
+    def __init__(self):
+        self.urls = set()
+
+    # Adds a URL and returns True if it had not been seen before
+    def add(self, url):
+        url = normalize_url(url)
+        if url in self.urls:
+            return False
+        self.urls.add(url)
+        return True
+
+    def __len__(self):
+        return len(self.urls)
+
+# Limits request rate per host (the connection pool limits concurrency per host)
+class HostLimiter:
+    def __init__(self, min_interval=per_host_interval):
+        self.min_interval = min_interval
+        self.next_request_times = {}
+
+    # Waits until the next request to the URL's host is allowed to start
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        start_time = max(now, self.next_request_times.get(host, now))
+        self.next_request_times[host] = start_time + self.min_interval
+        await asyncio.sleep(start_time - now)
 
-def department_scraper():
+# Shared across every department so the same pages are never fetched twice
+visited_urls = VisitedSet()
+host_limiter = HostLimiter()
+
+# Creates an aiohttp session with one connection pool shared by every request
+def create_session():
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=per_host_concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=request_timeout, sock_connect=request_timeout / 2)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers)
+
+# Reads the department URLs saved by department_scraper()
+def load_department_urls():
+    try:
+        with open(department_links_file, 'r') as file:
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+async def department_scraper(session):
     # The URL of the UC Berkeley Departments A-Z page
     url = "https://www.berkeley.edu/atoz/dept/"
 
-    # Spoof a browser User-Agent
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
     # Send a GET request to the webpage with headers
-    response = requests.get(url, headers=headers)
+    async with session.get(url) as response:
+        status = response.status
+        content = await response.read()
 
     # List to hold unique URLs
     url_list = []
 
     # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the page content with BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find all <a> tags with href attributes
-        a_tags = soup.find_all('a', href=True)
-
+    if status == 200:
         # Extract the href attribute (URL) from each <a> tag, filter for .berkeley.edu/ and add to list if unique
-        for tag in a_tags:
-            link = tag['href']
+        for link in extract_links(content):
             if link.endswith(".berkeley.edu/") and link not in url_list:
                 url_list.append(link)
 
         # Save the URLs to a txt file
-        with open('filtered_berkeley_links.txt', 'w') as file:
+        with open(department_links_file, 'w') as file:
             for url in sorted(url_list):  # Sort the URLs for readability
                 file.write(f"{url}\n")
 
@@ -58,89 +115,149 @@ def department_scraper():
         return url_list
 
     else:
-        print(f"Failed to retrieve the page. Status code: {response.status_code}")
+        print(f"Failed to retrieve the page. Status code: {status}")
+        return []
 
     # Now `url_list` contains all the unique URLs that end with ".berkeley.edu/"
 
-# Function to check if a URL is an HTML page (i.e., not a file like .pdf, .jpg, etc.)
-def is_html_page(url):
-    # Check common non-HTML file extensions
-    non_html_extensions = ['.pdf', '.docx', '.jpg', '.png', '.gif', '.xlsx', '.pptx', '.zip']
-    return not any(url.lower().endswith(ext) for ext in non_html_extensions)
+# Function to check if a response is an HTML page from its Content-Type header (available before the body is read)
+def is_html_response(response):
+    return response.content_type in ("text/html", "application/xhtml+xml")
 
-# Function to scrape pages for EdStem links
-def scrape_page(base_url, page_url):
-    try:
-        # Fetch the content of the page if it's an HTML page
-        if not is_html_page(page_url):
-            print(f"Skipping non-HTML file: {page_url}")
-            return None
-
-        response = requests.get(page_url)
-        if response.status_code != 200:
-            return None
-
-        # Parse the page content
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find all <a> tags and check their href attributes
-        links = soup.find_all('a', href=True)
-        for link in links:
-            href = link['href']
-            # Check if the href starts with the EdStem join URL
-            if href.startswith("https://edstem.org/us/join/"):
-                print(f"Found EdStem link: {href}")
-                # Append only the EdStem link to the text file using a lock to prevent race conditions
-                with file_lock:
-                    with open(edstem_links_file, 'a') as file:
-                        file.write(f"{href}\n")
-                return True  # Stop processing further links for this department once an EdStem link is found
-
-        # Extract internal links from the page and add to the crawl queue
-        for link in links:
-            href = link['href']
-            # Convert relative URLs to absolute URLs
-            full_url = urljoin(base_url, href)
-            # Only consider internal links (same domain as base_url)
-            if urlparse(base_url).netloc == urlparse(full_url).netloc:
-                if full_url not in visited_urls and is_html_page(full_url):
-                    visited_urls.add(full_url)
-                    return full_url  # Return the next URL to crawl
-    except Exception as e:
-        print(f"Error scraping {page_url}: {e}")
-        return None
-
-# Function to crawl a department website, stop after finding one EdStem link
-def crawl_department(base_url):
-    queue = deque([base_url])  # Queue to hold pages to crawl
+# Function to scrape a page, returns (EdStem join link or None, list of internal links on the page)
+async def scrape_page(session, base_url, page_url):
+    with metrics.timer("crawler.page"):
+        try:
+            print(f"Crawling {page_url}")
+            with metrics.timer("crawler.host_wait"):
+                await host_limiter.wait(page_url)
+            async with session.get(page_url) as response:
+                metrics.count("crawler.pages_loaded")
+                if response.status != 200:
+                    return None, []
+
+                # Skip files (PDFs, images, documents...) without downloading their bodies
+                if not is_html_response(response):
+                    print(f"Skipping non-HTML file: {page_url}")
+                    metrics.count("crawler.non_html_skipped")
+                    return None, []
+
+                # Parse the body as it streams in and stop reading as soon as an EdStem join link appears
+                link_stream = LinkStream()
+                hrefs = []
+                bytes_read = 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    for href in link_stream.feed(chunk):
+                        if href.startswith(edstem_join_prefix):
+                            return href, []
+                        hrefs.append(href)
+
+                    # Stop at the size limit
+                    bytes_read += len(chunk)
+                    metrics.count("crawler.bytes_read", len(chunk))
+                    if bytes_read >= max_page_bytes:
+                        break
+
+                for href in link_stream.close():
+                    if href.startswith(edstem_join_prefix):
+                        return href, []
+                    hrefs.append(href)
+
+            # Extract every internal link from the page (same domain as base_url)
+            internal_links = []
+            base_netloc = urlparse(base_url).netloc
+            for href in hrefs:
+                # Convert relative URLs to absolute URLs
+                full_url = urljoin(page_url, href)
+                if urlparse(full_url).scheme in ("http", "https") and urlparse(full_url).netloc == base_netloc:
+                    internal_links.append(full_url)
+            return None, internal_links
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error scraping {page_url}: {e!r}")
+            metrics.count("crawler.page_errors")
+            return None, []
+
+# Saves a found EdStem link to the text file
+def save_edstem_link(href):
+    with open(edstem_links_file, 'a') as file:
+        file.write(f"{href}\n")
+
+# Function to crawl a department website breadth first, stop after finding one EdStem link
+async def crawl_department(session, base_url):
+    frontier = deque([(base_url, 0)])  # Pages waiting to be crawled with their depth
     visited_urls.add(base_url)
+    pages_crawled = 0
+    in_flight = {}  # Running page tasks and the (url, depth) they are crawling
 
-    while queue:
-        current_url = queue.popleft()
-        print(f"Crawling {current_url}")
+    try:
+        while frontier or in_flight:
+            # Keep a few pages of the frontier in flight at once, within the page budget
+            while frontier and len(in_flight) < per_host_concurrency and pages_crawled < max_pages:
+                url, depth = frontier.popleft()
+                in_flight[asyncio.create_task(scrape_page(session, base_url, url))] = (url, depth)
+                pages_crawled += 1
 
-        # Scrape the current page
-        found_link = scrape_page(base_url, current_url)
+            if not in_flight:
+                break
 
-        # Stop crawling further if an EdStem link is found
-        if found_link is True:
-            print(f"Moving on to the next department after finding EdStem link in {base_url}")
-            return  # Stop further crawling for this department
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                url, depth = in_flight.pop(task)
+                edstem_link, internal_links = task.result()
 
-        # If new URLs are found, add them to the queue
-        elif found_link:
-            queue.append(found_link)
+                # Stop crawling further if an EdStem link is found
+                if edstem_link:
+                    print(f"Found EdStem link: {edstem_link}")
+                    metrics.count("crawler.edstem_links_found")
+                    save_edstem_link(edstem_link)
+                    print(f"Moving on to the next department after finding EdStem link in {base_url}")
+                    return edstem_link
+
+                # Add every newly discovered page to the frontier, within the depth budget
+                if depth < max_depth:
+                    for internal_link in internal_links:
+                        if visited_urls.add(internal_link):
+                            frontier.append((internal_link, depth + 1))
+                        else:
+                            metrics.count("links_skipped")
+    finally:
+        # Cancel the department's remaining requests (after a find, an error or cancellation)
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    print(f"Finished crawling {base_url} after {pages_crawled} pages without finding an EdStem link")
+    return None
+
+# Crawls every department concurrently over one shared session
+async def crawl_departments(department_urls=None):
+    async with create_session() as session:
+        # List of UC Berkeley department URLs to search (run department_scraper() to refresh the list)
+        department_urls = department_urls or load_department_urls() or await department_scraper(session)
+
+        # Bound how many departments are crawled at the same time
+        department_semaphore = asyncio.Semaphore(department_workers)
+
+        async def crawl_with_limit(department_url):
+            async with department_semaphore:
+                try:
+                    with metrics.timer("crawler.department"):
+                        return await crawl_department(session, department_url)
+                except Exception as e:
+                    print(f"Error during processing: {e!r}")
+
+        return await asyncio.gather(*(crawl_with_limit(department_url) for department_url in department_urls))
 
 # Main loop to go through each department in parallel
 def main():
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(crawl_department, department_url) for department_url in department_urls]
-
-        for future in as_completed(futures):
-            try:
-                future.result()  # Get result (to catch exceptions)
-            except Exception as e:
-                print(f"Error during processing: {e}")
+    asyncio.run(crawl_departments())
+
+    # Report where the crawl spent its time
+    metrics.summary()
+    metrics.write_trace("crawl_trace.json")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+from datetime import datetime
+from array import array
+from event_store import llm_columns, date_posted_to_iso
+import threading
+import hashlib
+import random
+import re
+
+# Large prime for the MinHash permutations (hashes are taken modulo it)
+minhash_prime = (1 << 61) - 1
+
+# EdStem appends the post's number in its course to the title (e.g. "... #1061"), which differs between cross-posts
+post_number_regex = re.compile(r"\s*#\d+\s*$")
+
+# Unwraps a post_dict value (one-element list) or an event store value (plain)
+def post_value(post, key):
+    value = post.get(key)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+# Word 3-grams of a post's title and description (single words for very short posts)
+def post_shingles(post):
+    title = post_number_regex.sub("", post_value(post, 'title') or "")
+    words = re.findall(r"\w+", f"{title} {post_value(post, 'description') or ''}".lower())
+    if len(words) < 3:
+        return set(words)
+    return {" ".join(words[index:index + 3]) for index in range(len(words) - 2)}
+
+# Days between two date_posted values (None if either is missing)
+def days_apart(date_posted, other_date_posted):
+    try:
+        first = datetime.strptime(date_posted_to_iso(date_posted), "%Y-%m-%dT%H:%M:%S.%fZ")
+        second = datetime.strptime(date_posted_to_iso(other_date_posted), "%Y-%m-%dT%H:%M:%S.%fZ")
+    except (TypeError, ValueError):
+        return None
+    return abs((first - second).total_seconds()) / 86400
+
+# MinHash/LSH index of classified posts, so a post cross-posted in several threads is only sent to the LLM once
+# Duplicates reuse the canonical post's classification and are stored linked to it (canonical_link)
+class DuplicateIndex:
+    def __init__(self, store, threshold=0.8, num_perm=64, bands=16, max_days_apart=14):
+        self.store = store
+        self.threshold = threshold  # Estimated Jaccard similarity from which posts count as the same event
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.max_days_apart = max_days_apart  # Reposts of a recurring event further apart than this are kept separate
+        self.lock = threading.Lock()
+
+        # Fixed seed so signatures saved by earlier runs stay comparable
+        generator = random.Random(1)
+        self.permutations = [(generator.randrange(1, minhash_prime), generator.randrange(0, minhash_prime)) for _ in range(num_perm)]
+
+        self.signatures = {}  # post_link -> signature
+        self.classifications = {}  # post_link -> LLM columns and date_posted
+        self.buckets = {}  # (band, band hash) -> post_links
+
+        with self.store.lock:
+            self.store.connection.execute("""
+                CREATE TABLE IF NOT EXISTS post_signatures (
+                    post_link TEXT PRIMARY KEY,
+                    signature BLOB NOT NULL
+                )
+            """)
+            self.store.connection.commit()
+        self.build()
+
+    # MinHash signature of a post
+    def signature(self, post):
+        shingle_hashes = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little") for shingle in post_shingles(post)]
+        if not shingle_hashes:
+            return None
+        return array('Q', (min((a * shingle_hash + b) % minhash_prime for shingle_hash in shingle_hashes) for a, b in self.permutations))
+
+    # Share of matching signature positions (estimates the Jaccard similarity of the shingles)
+    def similarity(self, signature, other_signature):
+        return sum(1 for value, other_value in zip(signature, other_signature) if value == other_value) / self.num_perm
+
+    # Keys of the LSH buckets a signature falls in, one per band
+    def band_keys(self, signature):
+        return [(band, hash(tuple(signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]))) for band in range(self.bands)]
+
+    # Adds a canonical post to the in-memory index (caller holds the lock)
+    def index_post(self, post_link, signature, classification):
+        self.signatures[post_link] = signature
+        self.classifications[post_link] = classification
+        for band_key in self.band_keys(signature):
+            self.buckets.setdefault(band_key, []).append(post_link)
+
+    # Loads every stored canonical post, computing and saving the signatures that are missing
+    def build(self):
+        with self.store.lock:
+            rows = self.store.connection.execute(f"""
+                SELECT posts.post_link, posts.title, posts.description, posts.date_posted, {', '.join('posts.' + column for column in llm_columns)}, post_signatures.signature
+                FROM posts LEFT JOIN post_signatures ON posts.post_link = post_signatures.post_link
+                WHERE posts.canonical_link IS NULL
+            """).fetchall()
+
+        new_signatures = []
+        with self.lock:
+            for row in rows:
+                if row['signature'] is not None:
+                    signature = array('Q')
+                    signature.frombytes(row['signature'])
+                else:
+                    signature = self.signature(dict(row))
+                    if signature is None:
+                        continue
+                    new_signatures.append((row['post_link'], signature.tobytes()))
+
+                classification = {column: row[column] for column in llm_columns}
+                classification['is_event'] = "TRUE" if row['is_event'] else "FALSE"
+                classification['date_posted'] = row['date_posted']
+                self.index_post(row['post_link'], signature, classification)
+
+        if new_signatures:
+            with self.store.lock:
+                with self.store.connection:
+                    self.store.connection.executemany("INSERT OR REPLACE INTO post_signatures (post_link, signature) VALUES (?, ?)", new_signatures)
+            print(f"Duplicate index: computed {len(new_signatures)} new signatures")
+
+    # Returns the link of an earlier post that is a near-duplicate of this one, or None
+    def find(self, post_dict):
+        signature = self.signature(post_dict)
+        if signature is None:
+            return None
+
+        post_link = post_value(post_dict, 'post_link')
+        date_posted = post_value(post_dict, 'date_posted')
+        best_link, best_similarity = None, self.threshold
+        with self.lock:
+            candidates = {candidate for band_key in self.band_keys(signature) for candidate in self.buckets.get(band_key, [])}
+            for candidate in candidates:
+                if candidate == post_link:
+                    continue
+                if self.too_far_apart(date_posted, self.classifications[candidate]['date_posted']):
+                    continue
+                similarity = self.similarity(signature, self.signatures[candidate])
+                if similarity >= best_similarity:
+                    best_link, best_similarity = candidate, similarity
+        return best_link
+
+    # Whether two posts were made too far apart to be the same event (posts without a date are never too far apart)
+    def too_far_apart(self, date_posted, other_date_posted):
+        posts_days_apart = days_apart(date_posted, other_date_posted)
+        return posts_days_apart is not None and posts_days_apart > self.max_days_apart
+
+    # Fills a post in from the classification of the post it duplicates and links it there
+    def copy_classification(self, post_dict, canonical_link, classification):
+        post_dict.update({column: post_value(classification, column) for column in llm_columns})
+        post_dict['canonical_link'] = canonical_link
+        print(f"Near-Duplicate of {canonical_link} Found: ", post_value(post_dict, 'title'))
+        return post_dict
+
+    # Fills a post in from its canonical post's classification if it is a near-duplicate, returns None otherwise
+    def classify_duplicate(self, post_dict):
+        canonical_link = self.find(post_dict)
+        if canonical_link is None:
+            return None
+
+        with self.lock:
+            classification = self.classifications[canonical_link]
+        return self.copy_classification(post_dict, canonical_link, classification)
+
+    # Splits a batch into (near-duplicates filled in from their canonical posts, posts that still need the LLM)
+    def split(self, post_dict_list):
+        duplicate_posts = []
+        unique_posts = []
+        for post_dict in post_dict_list:
+            if self.classify_duplicate(post_dict) is not None:
+                duplicate_posts.append(post_dict)
+            else:
+                unique_posts.append(post_dict)
+        return duplicate_posts, unique_posts
+
+    # Groups near-duplicates within a batch of new posts, returning (the first post of each group, (copy, first post) pairs)
+    # Only the first posts need the LLM, each copy then reuses its first post's answer through copy_classification
+    def group(self, post_dict_list):
+        representatives = []
+        representative_signatures = []
+        copies = []
+        for post_dict in post_dict_list:
+            signature = self.signature(post_dict)
+            representative = None
+            if signature is not None:
+                for candidate, candidate_signature in zip(representatives, representative_signatures):
+                    if candidate_signature is None or self.too_far_apart(post_value(post_dict, 'date_posted'), post_value(candidate, 'date_posted')):
+                        continue
+                    if self.similarity(signature, candidate_signature) >= self.threshold:
+                        representative = candidate
+                        break
+
+            if representative is not None:
+                copies.append((post_dict, representative))
+            else:
+                representatives.append(post_dict)
+                representative_signatures.append(signature)
+        return representatives, copies
+
+    # Adds a newly stored post so later copies of it are caught, and saves its signature
+    # Only called once the post is in the event store, so the index never points at a post that was not saved
+    def add(self, post_llm_dict):
+        if post_llm_dict.get('canonical_link'):
+            return False
+        signature = self.signature(post_llm_dict)
+        if signature is None:
+            return False
+
+        post_link = post_value(post_llm_dict, 'post_link')
+        classification = {column: post_value(post_llm_dict, column) for column in llm_columns}
+        classification['date_posted'] = post_value(post_llm_dict, 'date_posted')
+        with self.lock:
+            if post_link in self.signatures:
+                return False
+            self.index_post(post_link, signature, classification)
+
+        with self.store.lock:
+            with self.store.connection:
+                self.store.connection.execute("INSERT OR REPLACE INTO post_signatures (post_link, signature) VALUES (?, ?)", (post_link, signature.tobytes()))
+        return True
@@ -0,0 +1,94 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timezone
+from link_index import parse_edstem_link
+from instrumentation import metrics, timed
+import requests
+import re
+
+# Base URL of the EdStem JSON API (the web app at edstem.org/us talks to this)
+edstem_api_url = "https://us.edstem.org/api"
+
+# Reads the API token EdStem keeps in the browser's local storage after login
+def edstem_api_token(driver):
+    return driver.execute_script("return window.localStorage.getItem('authToken');")
+
+# Checks an API token with one cheap request (the current user), so a saved session is only used while it still works
+def edstem_token_valid(token, timeout=10):
+    if not token:
+        return False
+    try:
+        response = requests.get(f"{edstem_api_url}/user", headers={"x-token": token}, timeout=timeout)
+    except requests.RequestException:
+        return False
+    return response.status_code == 200
+
+# Creates a requests session that reuses the logged-in driver's credentials over a keep-alive connection pool
+def create_edstem_session(driver, pool_size=16):
+    session = requests.Session()
+
+    # Pool connections so parallel fetches reuse the same TLS connections, retry transient server errors
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+
+    # Authenticate with the API token
+    token = edstem_api_token(driver)
+    if token:
+        session.headers["x-token"] = token
+
+    # Copy session cookies across as well
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+
+    return session
+
+# Extracts the thread ID from an EdStem post link (e.g. https://edstem.org/us/courses/40590/discussion/5260653)
+def edstem_thread_id(post_link):
+    return parse_edstem_link(post_link)[1]
+
+# Fetches a post through the EdStem API and returns it in the same post_dict shape as post_scraper
+@timed("post_fetcher")
+def post_fetcher(session, post_link, timeout=10):
+    # Request the thread as JSON
+    thread_id = edstem_thread_id(post_link)
+    response = session.get(f"{edstem_api_url}/threads/{thread_id}", params={"view": 1}, timeout=timeout)
+    metrics.count("api_requests")
+    response.raise_for_status()
+    data = response.json()
+    thread = data['thread']
+
+    # Initialize dictionary
+    post_dict = {
+        "post_link": [post_link],
+        "title": [None],
+        "date_posted": [None],
+        "posted_by": [None],
+        "description": [None],
+        "image_url": [None]
+    }
+
+    # Title
+    post_dict['title'][0] = thread.get('title')
+
+    # Date Posted (converted to UTC to match the format post_scraper reads from the page)
+    if thread.get('created_at'):
+        created_at = datetime.fromisoformat(thread['created_at']).astimezone(timezone.utc)
+        post_dict['date_posted'][0] = created_at.strftime("%d-%b-%Y %H:%M:%S.%fZ")
+
+    # Posted By
+    users = {user['id']: user for user in data.get('users', [])}
+    author = users.get(thread.get('user_id'))
+    if author is not None:
+        post_dict['posted_by'][0] = author.get('name')
+
+    # Description (the API provides a plain text rendering of the post document)
+    post_dict['description'][0] = thread.get('document')
+
+    # Image URL (first image embedded in the post document)
+    image_match = re.search(r'<image[^>]*\ssrc="([^"]+)"', thread.get('content') or "")
+    if image_match is not None:
+        post_dict['image_url'][0] = image_match.group(1)
+
+    print(f"New Post Fetched: {post_dict['title'][0]}")
+    return post_dict
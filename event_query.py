@@ -0,0 +1,220 @@
+from datetime import datetime, date, time, timedelta
+from dataclasses import dataclass
+from event_store import EventStore
+from link_index import parse_edstem_link
+import threading
+import argparse
+import bisect
+import csv
+import re
+
+# Matches the course ID in a thread link from threads_database.csv
+thread_course_regex = re.compile(r"edstem\.org/(?:us/)?courses/(\d+)/")
+
+# Parsed, typed event read from the event store
+@dataclass(frozen=True)
+class Event:
+    rowid: int
+    post_link: str
+    course_id: int
+    department: str
+    title: str
+    date_posted: datetime | None
+    posted_by: str | None
+    description: str | None
+    image_url: str | None
+    event_type: str | None
+    event_date: date | None
+    event_time: time | None
+    event_location: str | None
+    is_food: str  # TRUE/FALSE/LIKELY
+    food_type: str | None
+
+    # When the event starts (midnight when only the date is known)
+    @property
+    def starts_at(self):
+        if self.event_date is None:
+            return None
+        return datetime.combine(self.event_date, self.event_time or time.min)
+
+# Parses a stored value with one of the given formats (None if it does not match any)
+def parse_datetime(value, *formats):
+    if not value:
+        return None
+    for format in formats:
+        try:
+            return datetime.strptime(value.strip(), format)
+        except ValueError:
+            pass
+    return None
+
+# Maps course IDs to department names using threads_database.csv
+def load_departments(threads_csv_path="threads_database.csv"):
+    departments = {}
+    try:
+        with open(threads_csv_path, mode='r', newline='', encoding='utf-8') as file:
+            for thread_dict in csv.DictReader(file):
+                match = thread_course_regex.search(thread_dict['Thread Link'])
+                if match is not None:
+                    departments[int(match.group(1))] = thread_dict['Department Name'].strip()
+    except FileNotFoundError:
+        pass
+    return departments
+
+# Builds an Event from an event store row
+def row_to_event(row, departments):
+    try:
+        course_id = parse_edstem_link(row['post_link'])[0]
+    except ValueError:
+        course_id = 0
+
+    event_date = parse_datetime(row['event_date'], "%d-%b-%Y")
+    event_time = parse_datetime(row['event_time'], "%I:%M %p")
+    food_type = row['food_type']
+    if food_type and food_type.strip().upper() in ("NONE", "NOT SPECIFIED", "N/A"):
+        food_type = None
+    is_food = (row['is_food'] or "").strip().upper()
+
+    return Event(
+        rowid=row['rowid'],
+        post_link=row['post_link'],
+        course_id=course_id,
+        department=departments.get(course_id, "Unknown"),
+        title=row['title'],
+        date_posted=parse_datetime(row['date_posted'], "%Y-%m-%dT%H:%M:%S.%fZ", "%d-%b-%Y %H:%M:%S.%fZ"),
+        posted_by=row['posted_by'],
+        description=row['description'],
+        image_url=row['image_url'],
+        event_type=row['event_type'],
+        event_date=event_date.date() if event_date else None,
+        event_time=event_time.time() if event_time else None,
+        event_location=row['event_location'],
+        is_food=is_food if is_food in ("TRUE", "LIKELY") else "FALSE",
+        food_type=food_type
+    )
+
+# In-memory indexes over the stored events, refreshed incrementally from the rows added since the last refresh
+class EventIndex:
+    def __init__(self, store, threads_csv_path="threads_database.csv"):
+        self.store = store
+        self.departments = load_departments(threads_csv_path)
+        self.lock = threading.Lock()
+        self.last_rowid = 0  # Every row up to this rowid has been indexed (rows are only ever appended)
+
+        self.events = []
+        self.start_keys = []  # Sorted start times of dated events...
+        self.start_events = []  # ...and the events in the same order
+        self.by_type = {}
+        self.by_department = {}
+        self.by_food = {}  # TRUE/LIKELY -> events
+        self.by_food_type = {}  # Lowercased food type -> events
+        self.refresh()
+
+    # Indexes rows stored since the last refresh, returning how many events were added
+    def refresh(self):
+        with self.lock:
+            with self.store.lock:
+                rows = self.store.connection.execute(
+                    "SELECT rowid, * FROM posts WHERE rowid > ? ORDER BY rowid", (self.last_rowid,)
+                ).fetchall()
+            if not rows:
+                return 0
+
+            added = 0
+            for row in rows:
+                self.last_rowid = max(self.last_rowid, row['rowid'])
+                # Near-duplicates are already listed through their canonical event
+                if row['is_event'] and row['canonical_link'] is None:
+                    self.add_event(row_to_event(row, self.departments))
+                    added += 1
+            return added
+
+    # Adds one event to every index (caller holds the lock)
+    def add_event(self, event):
+        self.events.append(event)
+
+        starts_at = event.starts_at
+        if starts_at is not None:
+            position = bisect.bisect_right(self.start_keys, starts_at)
+            self.start_keys.insert(position, starts_at)
+            self.start_events.insert(position, event)
+
+        if event.event_type:
+            self.by_type.setdefault(event.event_type, []).append(event)
+        self.by_department.setdefault(event.department, []).append(event)
+        if event.is_food != "FALSE":
+            self.by_food.setdefault(event.is_food, []).append(event)
+        if event.food_type:
+            self.by_food_type.setdefault(event.food_type.strip().lower(), []).append(event)
+
+    # Events starting between start and end (datetimes), in start order
+    def between(self, start, end):
+        self.refresh()
+        with self.lock:
+            low = bisect.bisect_left(self.start_keys, start)
+            high = bisect.bisect_right(self.start_keys, end)
+            return self.start_events[low:high]
+
+    # Events on a date
+    def on_date(self, day):
+        return self.between(datetime.combine(day, time.min), datetime.combine(day, time.max))
+
+    # Events starting in the next hours (events with only a date count for the whole day)
+    def upcoming(self, hours, now=None):
+        now = now or datetime.now()
+        events = self.between(datetime.combine(now.date(), time.min), now + timedelta(hours=hours))
+        return [event for event in events if event.starts_at >= now or (event.event_time is None and event.event_date == now.date())]
+
+    # Events with food (optionally also the ones likely to have food) starting in the next hours
+    def food_events(self, hours, now=None, include_likely=False):
+        food_answers = ("TRUE", "LIKELY") if include_likely else ("TRUE",)
+        return [event for event in self.upcoming(hours, now) if event.is_food in food_answers]
+
+    # Events of one type (Meeting/Workshop/Seminar/Lecture/Social/Fair)
+    def of_type(self, event_type):
+        self.refresh()
+        with self.lock:
+            return list(self.by_type.get(event_type, []))
+
+    # Events posted in a department's threads
+    def in_department(self, department):
+        self.refresh()
+        with self.lock:
+            return list(self.by_department.get(department, []))
+
+    # Events with food, optionally of one food type (e.g. pizza)
+    def with_food(self, food_type=None, include_likely=False):
+        self.refresh()
+        with self.lock:
+            if food_type is not None:
+                events = self.by_food_type.get(food_type.strip().lower(), [])
+                return [event for event in events if event.is_food == "TRUE" or (include_likely and event.is_food == "LIKELY")]
+            events = list(self.by_food.get("TRUE", []))
+            if include_likely:
+                events += self.by_food.get("LIKELY", [])
+            return events
+
+def main():
+    parser = argparse.ArgumentParser(description="List upcoming events with free food")
+    parser.add_argument("--hours", type=float, default=24, help="how far ahead to look")
+    parser.add_argument("--likely", action="store_true", help="include events that will likely have food")
+    parser.add_argument("--department", help="only events from this department")
+    parser.add_argument("--database", default="events.db")
+    args = parser.parse_args()
+
+    store = EventStore(args.database)
+    event_index = EventIndex(store)
+
+    events = event_index.food_events(args.hours, include_likely=args.likely)
+    if args.department:
+        events = [event for event in events if event.department == args.department]
+
+    for event in events:
+        when = event.starts_at.strftime("%a %d-%b %I:%M %p") if event.event_time else event.event_date.strftime("%a %d-%b (time TBA)")
+        print(f"{when} | {event.department} | {event.title} | {event.event_location or 'Location TBA'} | {event.food_type or 'Food'}")
+    print(f"{len(events)} food events in the next {args.hours:g} hours")
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+from datetime import datetime
+import threading
+import sqlite3
+import time
+import ast
+import csv
+import io
+
+# Columns stored for every post, in the same order as the CSV databases
+post_columns = [
+    "post_link",
+    "title",
+    "date_posted",
+    "posted_by",
+    "description",
+    "image_url",
+    "is_event",
+    "event_type",
+    "event_date",
+    "event_time",
+    "event_location",
+    "is_food",
+    "food_type"
+]
+
+# Columns filled in by the LLMs
+llm_columns = post_columns[6:]
+
+# Unwraps a CSV cell written as a stringified one-element list (e.g. "['https://...\n']") into its value
+def unwrap_cell(value):
+    if value is None or value == "":
+        return None
+    if value.startswith("[") and value.endswith("]"):
+        try:
+            unwrapped = ast.literal_eval(value)
+            value = unwrapped[0] if unwrapped else None
+        except (ValueError, SyntaxError):
+            value = value.strip("[]'")
+    if isinstance(value, str):
+        value = value.strip()
+    return value
+
+# Converts the scraper's date_posted format (%d-%b-%Y %H:%M:%S.%fZ) to ISO 8601 so it sorts correctly
+def date_posted_to_iso(date_posted):
+    if not date_posted:
+        return None
+    try:
+        return datetime.strptime(date_posted, "%d-%b-%Y %H:%M:%S.%fZ").strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        return date_posted
+
+# Converts an analyzed post_dict (mix of one-element lists and plain values) into a flat row
+def post_to_row(post_llm_dict):
+    row = {}
+    for column in post_columns:
+        value = post_llm_dict.get(column)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, str):
+            value = value.strip()
+
+            # Rows from the old regex parser (migrated from the CSVs) can still carry JSON-style quotes and trailing commas
+            if column in llm_columns:
+                value = value.rstrip(",").strip().strip('"').strip()
+        row[column] = value
+
+    row['date_posted'] = date_posted_to_iso(row['date_posted'])
+    row['is_event'] = 1 if str(row['is_event']).upper() == "TRUE" else 0
+
+    # Near-duplicates of an earlier post are linked to it (see duplicate_index.py)
+    row['canonical_link'] = post_llm_dict.get('canonical_link')
+    return row
+
+# Reports each newly stored post
+def print_inserted_rows(inserted_rows):
+    for row in inserted_rows:
+        if row.get('canonical_link'):
+            print(f"Successfuly Linked Duplicate Post to {row['canonical_link']}: {row['title']}")
+        elif row['is_event']:
+            print(f"Successfuly Added Event to events database: {row['title']}")
+        else:
+            print(f"Successfuly Added Post to rejected database: {row['title']}")
+
+# Adds the is_event and duplicate filters to a query over the posts table
+def posts_query(query, is_event, include_duplicates):
+    conditions = []
+    params = []
+    if is_event is not None:
+        conditions.append("is_event = ?")
+        params.append(1 if is_event else 0)
+    if not include_duplicates:
+        conditions.append("canonical_link IS NULL")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, tuple(params)
+
+# Indexed SQLite store for analyzed posts, replacing events_database.csv and rejected_database.csv
+class EventStore:
+    def __init__(self, path="events.db"):
+        self.path = path
+
+        # One connection shared by every worker thread, guarded by a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                post_link TEXT PRIMARY KEY,
+                title TEXT,
+                date_posted TEXT,
+                posted_by TEXT,
+                description TEXT,
+                image_url TEXT,
+                is_event INTEGER NOT NULL,
+                event_type TEXT,
+                event_date TEXT,
+                event_time TEXT,
+                event_location TEXT,
+                is_food TEXT,
+                food_type TEXT,
+                added_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS posts_is_event ON posts (is_event);
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+        # Columns added after the first version of the store
+        columns = {row['name'] for row in self.connection.execute("PRAGMA table_info(posts)")}
+        if "canonical_link" not in columns:
+            self.connection.execute("ALTER TABLE posts ADD COLUMN canonical_link TEXT")
+        self.connection.commit()
+
+    # Checks whether a post link has already been stored (events or rejected)
+    def contains(self, post_link):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM posts WHERE post_link = ?", (post_link,)).fetchone()
+        return row is not None
+
+    # Returns every stored post link
+    def links(self):
+        with self.lock:
+            return {row[0] for row in self.connection.execute("SELECT post_link FROM posts")}
+
+    # Inserts rows inside an open transaction, returning the rows that were new
+    def insert_rows(self, rows):
+        added_at = time.time()
+        inserted_rows = []
+        for row in rows:
+            cursor = self.connection.execute(
+                f"INSERT OR IGNORE INTO posts ({', '.join(post_columns)}, canonical_link, added_at) VALUES ({', '.join('?' for _ in post_columns)}, ?, ?)",
+                [row[column] for column in post_columns] + [row.get('canonical_link'), added_at]
+            )
+            if cursor.rowcount:
+                inserted_rows.append(row)
+        return inserted_rows
+
+    # Adds analyzed posts in one transaction, skipping links that are already stored
+    def add_posts(self, post_llm_dict_list):
+        rows = [post_to_row(post_llm_dict) for post_llm_dict in post_llm_dict_list]
+        with self.lock:
+            with self.connection:
+                inserted_rows = self.insert_rows(rows)
+
+        print_inserted_rows(inserted_rows)
+        return len(inserted_rows)
+
+    # Adds a single analyzed post
+    def add_post(self, post_llm_dict):
+        return self.add_posts([post_llm_dict])
+
+    # Returns stored posts as dictionaries, optionally only events or only rejected posts
+    # Near-duplicates linked to a canonical post are left out unless include_duplicates is set
+    def posts(self, is_event=None, include_duplicates=False):
+        query, params = posts_query("SELECT * FROM posts", is_event, include_duplicates)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(query, params)]
+
+    # Number of stored posts
+    def count(self, is_event=None, include_duplicates=False):
+        query, params = posts_query("SELECT COUNT(*) FROM posts", is_event, include_duplicates)
+        with self.lock:
+            return self.connection.execute(query, params).fetchone()[0]
+
+    # One-time import of the legacy CSV databases (rows are read with their stringified list cells unwrapped)
+    def migrate_from_csv(self, events_csv_path="events_database.csv", rejected_csv_path="rejected_database.csv"):
+        with self.lock:
+            migrated = self.connection.execute("SELECT value FROM store_meta WHERE key = 'csv_migrated'").fetchone()
+        if migrated is not None:
+            return 0
+
+        print("Migrating CSV databases to the event store...")
+        rows = []
+        header = ",".join(post_columns)
+        for csv_path, is_event in [(events_csv_path, True), (rejected_csv_path, False)]:
+            try:
+                with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+                    text = file.read()
+            except FileNotFoundError:
+                continue
+
+            # The first appended row can end up on the header line when the header has no trailing newline
+            if text.startswith(header) and text[len(header):len(header) + 1] not in ("", "\r", "\n"):
+                text = header + "\n" + text[len(header):]
+
+            for csv_row in csv.DictReader(io.StringIO(text, newline='')):
+                post_llm_dict = {column: unwrap_cell(csv_row.get(column)) for column in post_columns}
+                if not post_llm_dict['post_link']:
+                    continue
+
+                # The database a row was written to is the source of truth for is_event
+                post_llm_dict['is_event'] = "TRUE" if is_event else "FALSE"
+                rows.append(post_to_row(post_llm_dict))
+
+        with self.lock:
+            with self.connection:
+                inserted_rows = self.insert_rows(rows)
+                self.connection.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('csv_migrated', ?)", (str(time.time()),))
+
+        print(f"Migrated {len(inserted_rows)} posts to the event store!")
+        return len(inserted_rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
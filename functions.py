@@ -1,26 +1,177 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
-from gradio_client import Client, handle_file
-from datetime import datetime
-from openai import OpenAI
-import pandas as pd
+from datetime import datetime, timezone
+from llm_cache import llm_cache_key
+from edstem_api import edstem_thread_id, edstem_api_token, edstem_token_valid
+from link_index import normalize_edstem_link
+from image_cache import is_poster_url
+from instrumentation import metrics, timed
+from rate_limiter import RequestScheduler
+import threading
+import json
+import os
 import re
-import time
 import csv
 
+# Models used for classification
+post_llm_model = "gpt-4o-mini"
+post_image_llm_model = "openbmb/MiniCPM-Llama3-V-2_5"
+
+# Bump whenever the questions or parsing change so cached LLM results are not reused
+llm_prompt_version = "2"
+
+# Allowed answers
+event_types = ["Meeting", "Workshop", "Seminar", "Lecture", "Social", "Fair"]
+is_food_answers = ["TRUE", "FALSE", "LIKELY"]
+
+# Questions the LLMs answer for every post
+post_llm_questions = """
+        is_event = true/false
+        event_type = Meeting/Workshop/Seminar/Lecture/Social/Fair (null if not an event)
+        event_date = <FORMAT DATE IN %d-%b-%Y FORMAT, IF YEAR IS NOT GIVEN USE YEAR GIVEN DATE POSTED> (null if unknown)
+        event_time = <FORMAT TIME IN XX:XX AM/PM FORMAT> (null if unknown)
+        event_location = <FILL IN LOCATION> (null if unknown)
+        is_food = TRUE/FALSE/LIKELY (TRUE IF MENTIONED, FALSE IF NOT MENTIONED AND NOT HOSTED BY BIG COMPANY, LIKELY IF NOT MENTIONED BUT HOSTED BY BIG COMPANY, PUT LIKELY)
+        food_type = None/Not Specified/<ONE WORD ANSWER OF WHAT THE FOOD WILL BE>
+"""
+
+# JSON schema of one post's answers, used for structured outputs and to validate replies
+post_llm_answer_properties = {
+    "is_event": {"type": "boolean"},
+    "event_type": {"type": ["string", "null"], "enum": event_types + [None]},
+    "event_date": {"type": ["string", "null"], "description": "Date in %d-%b-%Y format, e.g. 14-Oct-2024"},
+    "event_time": {"type": ["string", "null"], "description": "Start time in hh:mm AM/PM format, e.g. 12:00 PM"},
+    "event_location": {"type": ["string", "null"]},
+    "is_food": {"type": "string", "enum": is_food_answers},
+    "food_type": {"type": ["string", "null"]}
+}
+
+# JSON schema of a batch reply (a list of answers tagged with the post IDs they belong to)
+post_llm_batch_schema = {
+    "type": "object",
+    "properties": {
+        "posts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, **post_llm_answer_properties},
+                "required": ["id"] + list(post_llm_answer_properties),
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["posts"],
+    "additionalProperties": False
+}
+
+# How many times a post is sent to an LLM before giving up on it
+max_llm_attempts = 3
+
+# Longest description (in characters) sent to the LLM for a single post
+max_description_length = 4000
+
+# Shared limits for every OpenAI and Hugging Face call (defaults match gpt-4o-mini's tier 1 quota, the buckets follow the
+# x-ratelimit headers once responses arrive)
+# Concurrency tops out at main.py's llm_workers and vision_workers (kept small so each OpenAI request carries a full batch),
+# the adaptive limit only lowers it after rate limits. Poster uploads skip hf_scheduler, so 30 requests/min is 30 answers/min
+openai_scheduler = RequestScheduler("openai", requests_per_minute=500, tokens_per_minute=200000, initial_concurrency=4, max_concurrency=4)
+hf_scheduler = RequestScheduler("huggingface", requests_per_minute=30, initial_concurrency=2, max_concurrency=2)
+
+# OpenAI clients shared across calls, one per API key
+openai_clients = {}
+openai_clients_lock = threading.Lock()
+
+# Gradio clients reused by each thread (the vision Space keeps chat state per client, so threads cannot share one)
+gradio_clients = threading.local()
+
+# Creates a new Chrome WebDriver session
+# A profile directory keeps cookies and local storage between runs (only one driver can use a profile at a time)
+def create_driver(headless=False, profile_dir=None):
+    # Selenium is imported on first use so commands that never start a browser load quickly
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    # Configure Chrome options
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    if profile_dir is not None:
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(profile_dir)}")
+
+    # Start the browser
+    return webdriver.Chrome(options=chrome_options)
+
+# Reads a driver's EdStem session (cookies and the local storage holding the auth token)
+def read_session(driver):
+    return {
+        "cookies": driver.get_cookies(),
+        "local_storage": driver.execute_script("return Object.assign({}, window.localStorage);")
+    }
+
+# Loads an EdStem session into a driver
+def apply_session(driver, session_data):
+    # The driver has to be on the EdStem domain before cookies and local storage can be set
+    driver.get("https://edstem.org/us/")
+
+    # Copy every cookie across
+    for cookie in session_data['cookies']:
+        # Chrome rejects the sameSite attribute on some cookies, so drop it
+        cookie = {key: value for key, value in cookie.items() if key != "sameSite"}
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            pass
+
+    # Copy local storage across
+    for key, value in session_data['local_storage'].items():
+        driver.execute_script("window.localStorage.setItem(arguments[0], arguments[1]);", key, value)
+
+# Copies an authenticated EdStem session (cookies and local storage) from one driver to another so only one login is needed
+def copy_session_cookies(source_driver, target_driver):
+    apply_session(target_driver, read_session(source_driver))
+
+# Reuses a still valid session from the driver's profile or the session store, returns True if no login is needed
+def restore_edstem_session(driver, session_store):
+    # A Chrome profile may still be logged in
+    driver.get("https://edstem.org/us/")
+    if edstem_token_valid(edstem_api_token(driver)):
+        print("EdStem session from the browser profile is still valid!")
+        session_store.save(read_session(driver))
+        return True
+
+    # Otherwise try the saved session
+    session_data = session_store.load()
+    if session_data is not None and edstem_token_valid(session_data['local_storage'].get('authToken')):
+        apply_session(driver, session_data)
+        print("Saved EdStem session restored!")
+        return True
+
+    if session_data is not None:
+        print("Saved EdStem session has expired, logging in again")
+        session_store.clear()
+    return False
+
 # Authenticates and logs into EdStem using CalNet for the session
-def edstem_login(driver, user, user_email, user_password):
+# With a session store a still valid saved session is reused, and a new one is saved after logging in
+@timed("edstem_login")
+def edstem_login(driver, user, user_email, user_password, session_store=None):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Skip CalNet and Duo when the last session still works
+    if session_store is not None:
+        with metrics.timer("edstem_login.restore"):
+            if restore_edstem_session(driver, session_store):
+                metrics.count("sessions_restored")
+                return
+
     # Navigate to EdStem login page
     edstem_login_url = "https://edstem.org/us/login"
-    driver.get(edstem_login_url)
+    with metrics.timer("edstem_login.page_load"):
+        driver.get(edstem_login_url)
 
-    # Wait for the page to load and URL to be updated
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "x1")))
+        # Wait for the page to load and URL to be updated
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "x1")))
+    metrics.count("pages_loaded")
 
     # Get current URL
     current_url = driver.current_url
@@ -58,65 +209,213 @@ def edstem_login(driver, user, user_email, user_password):
             calnet_submit_button.click()
 
             # Wait for Duo Push authentication
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "app")))
-            WebDriverWait(driver, 120).until(EC.presence_of_element_located((By.CLASS_NAME, "dash-courses")))
+            with metrics.timer("edstem_login.duo"):
+                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "app")))
+                WebDriverWait(driver, 120).until(EC.presence_of_element_located((By.CLASS_NAME, "dash-courses")))
 
             print("Authentication Completed!")
         except Exception as e:
             pass
 
+    # Save the new session so the next runs can skip the login
+    if session_store is not None and edstem_api_token(driver):
+        session_store.save(read_session(driver))
+
+# JavaScript that returns the link of every post row currently loaded in a thread's list in one call
+loaded_post_links_script = """
+return Array.from(document.querySelectorAll('.dlv-item'))
+    .map(item => item.querySelector('a'))
+    .filter(link => link !== null)
+    .map(link => link.href);
+"""
+
+# JavaScript that returns [link, last activity time or null] for every post row currently loaded in a thread's list
+loaded_post_rows_script = """
+return Array.from(document.querySelectorAll('.dlv-item'))
+    .filter(item => item.querySelector('a') !== null)
+    .map(item => {
+        const time = item.querySelector('time');
+        return [item.querySelector('a').href, time ? time.getAttribute('datetime') : null];
+    });
+"""
+
+# JavaScript that scrolls a thread's list and resolves once new rows have been added (or the timeout passes)
+# Resolves with [rows added, milliseconds waited]; waits for a short quiet period so a page of rows arriving in pieces counts as one step
+scroll_and_wait_script = """
+const container = arguments[0];
+const timeoutMs = arguments[1];
+const settleMs = arguments[2];
+const done = arguments[arguments.length - 1];
+const countItems = () => document.querySelectorAll('.dlv-item').length;
+const before = countItems();
+const start = performance.now();
+let settleTimer = null;
+let finished = false;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timeoutTimer);
+    clearTimeout(settleTimer);
+    done([countItems() - before, Math.round(performance.now() - start)]);
+};
+const observer = new MutationObserver(() => {
+    if (countItems() > before) {
+        clearTimeout(settleTimer);
+        settleTimer = setTimeout(finish, settleMs);
+    }
+});
+observer.observe(container, {childList: true, subtree: true});
+const timeoutTimer = setTimeout(finish, timeoutMs);
+container.scrollTop = container.scrollHeight;
+"""
+
+# Scroll wait limits (milliseconds), the timeout adapts to how fast rows have been arriving
+min_scroll_timeout = 1000
+max_scroll_timeout = 15000
+scroll_settle_time = 150
+
+# Rows EdStem loads per scroll; without activity times a whole page of known posts is needed before stopping early
+thread_page_size = 30
+
+# Returns the links of every post row currently loaded in a thread's list
+def loaded_post_links(driver):
+    return driver.execute_script(loaded_post_links_script)
+
+# Returns [link, last activity time] for every post row currently loaded in a thread's list
+def loaded_post_rows(driver):
+    return driver.execute_script(loaded_post_rows_script)
+
+# Parses a row's activity time (ISO 8601) or a thread's Last Scraped value (UTC) as an aware datetime, None if it is missing or malformed
+def parse_utc_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%d-%b-%Y %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    # Times without an offset are taken as UTC
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+# Whether scrolling can stop because every post further down was already seen on the last run
+# Rows are sorted by newest activity, so an old post that got a reply sorts above newer posts that are not loaded yet:
+# stop once the last row's activity is older than the last run, or (when rows show no activity time) once a whole page is known
+def reached_scraped_posts(rows, last_post_id, last_scraped):
+    if not rows:
+        return False
+    last_activity = parse_utc_time(rows[-1][1])
+    if last_activity is not None and last_scraped is not None:
+        return last_activity < last_scraped
+
+    last_page = rows[-thread_page_size:]
+    return len(last_page) == thread_page_size and all(edstem_thread_id(href) <= last_post_id for href, _ in last_page)
+
+# Scrolls a thread's list once and waits for new rows, returning the number of rows loaded and the time it took (ms)
+@timed("thread_scraper.scroll")
+def scroll_and_wait(driver, scroll_container, timeout):
+    driver.set_script_timeout(timeout / 1000 + 5)
+    added, elapsed = driver.execute_async_script(scroll_and_wait_script, scroll_container, timeout, scroll_settle_time)
+    return added, elapsed
+
+# Canonical links of the loaded posts newer than last_post_id (once each, minus posts the link index already knows),
+# and the thread's new high-water mark, taken from every loaded post so known posts still move it forward
+def new_thread_post_links(loaded_links, last_post_id, link_index=None):
+    loaded_links = [normalize_edstem_link(href) for href in loaded_links]
+    new_post_links = []
+    for href in loaded_links:
+        if edstem_thread_id(href) <= last_post_id or href in new_post_links:
+            continue
+        if link_index is not None and link_index.contains(href):
+            metrics.count("links_skipped")
+            continue
+        new_post_links.append(href)
+
+    high_water_mark = max([last_post_id] + [edstem_thread_id(href) for href in loaded_links])
+    return new_post_links, high_water_mark
+
 # Scrapes each department's EdStem event thread and adds post links to new_post_links.txt
-def dept_edstem_thread_scraper(driver, thread_dict):
+# In incremental mode scrolling stops once the loaded rows reach posts seen on the last run, and only newer posts are added
+# Links are returned, and also appended to new_post_links_file unless it is None
+# With a link index, posts that are already known are dropped here as well
+@timed("thread_scraper")
+def dept_edstem_thread_scraper(driver, thread_dict, incremental=True, new_post_links_file='new_post_links.txt', link_index=None):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     # Assign dictionary values to variables
     dept_name = thread_dict['Department Name']
     thread_name = thread_dict['Thread Name']
     thread_link = thread_dict['Thread Link']
 
-    # File to save new post links
-    new_post_links_file = 'new_post_links.txt'
+    # Newest post ID seen on a previous run (0 if the thread has never been scraped), and when that run started
+    last_post_id = int(thread_dict.get('Last Post ID') or 0) if incremental else 0
+    last_scraped = parse_utc_time(thread_dict.get('Last Scraped'))
+
+    # Taken before loading so posts made while this run scrolls are newer than the next run's mark
+    scrape_started = datetime.now(timezone.utc)
 
     # Navigate to department events thread
-    driver.get(thread_link)
+    with metrics.timer("thread_scraper.page_load"):
+        driver.get(thread_link)
 
-    # Wait until the specific container element is present on the page
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "dlr-list")))
+        # Wait until the specific container element is present on the page
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "dlr-list")))
+    metrics.count("pages_loaded")
 
     # Get the scrolling container element
     scroll_container = driver.find_element(By.CLASS_NAME, "dlr-list")
 
     # Scroll to the bottom of the threads container
-    print("Loading all posts...")
-    last_scroll_height = 0  # Variable to keep track of the previous scroll height
+    print("Loading all posts..." if not last_post_id else f"Loading posts newer than {last_post_id}...")
+    scroll_timeout = 2000  # How long to wait for each scroll's rows, adapted as pages load
+    empty_scrolls = 0  # Consecutive scrolls that loaded nothing
 
     while True:
-        # Get the current scroll height of the container
-        current_scroll_height = driver.execute_script("return arguments[0].scrollHeight", scroll_container)
-
-        # Scroll down the specific container by executing JavaScript
-        driver.execute_script("arguments[0].scrollTop = arguments[0].scrollHeight", scroll_container)
-
-        # Wait for the new content to load (adjust this time based on page speed)
-        time.sleep(2)
-
-        # Check if the scroll height has changed
-        if current_scroll_height == last_scroll_height:
-            print(f"All posts from the {dept_name} department's {thread_name} thread have been loaded!")
-            break  # Exit the loop if scrolling does not change the scroll height
+        # Stop once everything below the loaded rows was already seen on the last run
+        if last_post_id:
+            if reached_scraped_posts(loaded_post_rows(driver), last_post_id, last_scraped):
+                print(f"Reached previously scraped posts in the {dept_name} department's {thread_name} thread!")
+                break
+
+        # Scroll down and wait for the list to grow instead of sleeping a fixed time
+        added, elapsed = scroll_and_wait(driver, scroll_container, scroll_timeout)
+
+        if added:
+            # Wait about three times as long as the last page took, within limits
+            empty_scrolls = 0
+            scroll_timeout = min(max(3 * elapsed, min_scroll_timeout), max_scroll_timeout)
+        else:
+            # Give a lagging network one more, longer chance before deciding the list is complete
+            empty_scrolls += 1
+            if empty_scrolls >= 2:
+                print(f"All posts from the {dept_name} department's {thread_name} thread have been loaded!")
+                break
+            scroll_timeout = min(scroll_timeout * 2, max_scroll_timeout)
+
+    # Keep only posts newer than the high-water mark, once each, in canonical form
+    new_post_links, high_water_mark = new_thread_post_links(loaded_post_links(driver), last_post_id, link_index)
+
+    # Add links to new_post_links_file
+    if new_post_links_file is not None:
+        print("Adding post links to database...")
+        with open(new_post_links_file, 'a') as file:
+            for href in new_post_links:
+                file.write(f"{href}\n")
 
-        last_scroll_height = current_scroll_height  # Update the scroll height for the next iteration
+    # Record the new high-water mark and when this run started on the thread
+    if high_water_mark:
+        thread_dict['Last Post ID'] = str(high_water_mark)
+    thread_dict['Last Scraped'] = scrape_started.strftime("%d-%b-%Y %H:%M:%S")
 
-    # Find all threads with the <a> tag and class "dtl-thread discuss-feed-thread dft-full"
-    event_divs = driver.find_elements(By.CLASS_NAME, "dlv-item")
-
-    # Iterate through each thread and add link to events_list
-    print("Adding post links to database...")
-    for index, event_div in enumerate(event_divs):
-        # Extract the link from thread
-        href = event_div.find_element(By.TAG_NAME, "a").get_attribute("href")
-        # Add link to new_post_links_file
-        with open(new_post_links_file, 'a') as file:
-            file.write(f"{href}\n")
-    print(f"Finished adding all post links from the {dept_name} department's {thread_name} thread to database!")
+    print(f"Finished adding {len(new_post_links)} post links from the {dept_name} department's {thread_name} thread to database!")
+    return new_post_links
 
 # Opens threads_database.csv and converts it into a list of dictionaries
 def threads_database_parser():
@@ -135,25 +434,55 @@ def threads_database_parser():
         print("Threads Database parsed!")
         return data_list
 
-# Runs MiniCPM-Llama3-V-2_5 LLM to analyze post and associated poster to fill in event details
-def post_image_llm(hf_token, post_text, image_url):
-    # Define dictionary to be filled
-    post_llm_dict = {
-        "is_event": None,
-        "event_type": None,
-        "event_date": None,
-        "event_time": None,
-        "event_location": None,
-        "is_food": None,
-        "food_type": None
-    }
+# Saves the list of thread dictionaries (including their high-water marks) back to threads_database.csv
+def threads_database_writer(thread_dict_list):
+    # Path to threads_database.csv
+    threads_database_file_path = 'threads_database.csv'
+
+    # Keep the original column order and append any new columns
+    fieldnames = ['Department Name', 'Thread Name', 'Thread Link', 'Last Post ID', 'Last Scraped']
+    for thread_dict in thread_dict_list:
+        for key in thread_dict:
+            if key not in fieldnames:
+                fieldnames.append(key)
+
+    with open(threads_database_file_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(thread_dict_list)
 
-    # If no image, use black image
-    if image_url == None:
-        image_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/4/49/A_black_image.jpg/640px-A_black_image.jpg"
+    print("Threads Database saved!")
 
-    # Initialize the client for the openbmb/MiniCPM-Llama3-V-2_5 model
-    client = Client("openbmb/MiniCPM-Llama3-V-2_5", hf_token=hf_token)
+# Runs MiniCPM-Llama3-V-2_5 LLM to analyze post and associated poster to fill in event details
+# Returns None when there is no poster or no valid answer after max_llm_attempts
+@timed("post_image_llm")
+def post_image_llm(hf_token, post_text, image_url, cache=None, image_cache=None):
+    # Posts without a real poster (no image, or an inline SVG icon) skip the vision model
+    if not is_poster_url(image_url):
+        return None
+
+    # Use the locally cached copy of the poster, keyed by its content
+    if image_cache is not None:
+        image_path = image_cache.get(image_url)
+        image_key = image_cache.content_hash(image_path)
+    elif image_url.startswith("data:"):
+        # Inline images have to be written to a file first, which needs the image cache
+        return None
+    else:
+        image_path = image_url
+        image_key = image_url
+
+    # Check the cache first
+    cache_key = llm_cache_key({"post_text": post_text, "image": image_key}, post_image_llm_model, llm_prompt_version)
+    if cache is not None:
+        cached_post_llm_dict = cache.get(cache_key)
+        if cached_post_llm_dict is not None:
+            metrics.count("image_llm_cache_hits")
+            return cached_post_llm_dict
+        metrics.count("image_llm_cache_misses")
+
+    # Reuse this thread's client for the openbmb/MiniCPM-Llama3-V-2_5 model
+    client = get_gradio_client(hf_token)
 
     # Additional context (from post_text) and define questions asked
     question = f"""
@@ -161,63 +490,72 @@ def post_image_llm(hf_token, post_text, image_url):
     {post_text}
 
     Questions to Answer:
-    is_event = TRUE/FALSE
-    event_type = Meeting/Workshop/Seminar/Lecture/Social/Fair
-    event_date = <FORMAT DATE IN %d-%b-%Y FORMAT, IF YEAR IS NOT GIVEN USE YEAR GIVEN DATE POSTED>
-    event_time = <FORMAT TIME IN XX:XX AM/PM FORMAT>
-    event_location = <FILL IN LOCATION>
-    is_food = TRUE/FALSE/LIKELY (TRUE IF MENTIONED, FALSE IF NOT MENTIONED AND NOT HOSTED BY BIG COMPANY, LIKELY IF NOT MENTIONED BUT HOSTED BY BIG COMPANY, PUT LIKELY)
-    food_type = None/Not Specified/<ONE WORD ANSWER OF WHAT THE FOOD WILL BE>
+    {post_llm_questions}
+
+    Reply with only a JSON object with the keys is_event, event_type, event_date, event_time, event_location, is_food and food_type.
     """
 
-    # Upload the image
+    # Upload the image (not an inference call, so it does not count against hf_scheduler)
     upload_result = client.predict(
-        image=handle_file(image_url),  # Handle the image from the URL
+        image=gradio_file(image_path),  # Handle the image from the local cache (or URL)
         _chatbot=[],  # Empty chatbot context
         api_name="/upload_img"  # Use the correct API endpoint for image analysis
     )
 
-    # Send the question to the model using the `/respond` endpoint
-    question_result = client.predict(
-        _chat_bot=[[question, None]],  # Send the question with chatbot context
-        params_form="Sampling",  # Use sampling for the generation
-        num_beams=3,  # Number of beams for beam search (for better responses)
-        repetition_penalty=1.2,  # Avoid repetitive outputs
-        repetition_penalty_2=1.05,
-        top_p=0.8,
-        top_k=100,
-        temperature=0.7,  # Adjust creativity level
-        api_name="/respond"  # This is the endpoint for generating responses
-    )
+    # Ask again (up to max_llm_attempts times) until the reply is valid JSON with valid values
+    for attempt in range(max_llm_attempts):
+        if attempt:
+            metrics.count("image_llm_retries")
+
+        # Send the question to the model using the `/respond` endpoint
+        with metrics.timer("post_image_llm.request"):
+            question_result = hf_scheduler.call(lambda: client.predict(
+                _chat_bot=[[question, None]],  # Send the question with chatbot context
+                params_form="Sampling",  # Use sampling for the generation
+                num_beams=3,  # Number of beams for beam search (for better responses)
+                repetition_penalty=1.2,  # Avoid repetitive outputs
+                repetition_penalty_2=1.05,
+                top_p=0.8,
+                top_k=100,
+                temperature=0.7,  # Adjust creativity level
+                api_name="/respond"  # This is the endpoint for generating responses
+            ))
 
-    # Output the final result
-    question_response = question_result[0][1]
+        # Output the final result
+        question_response = question_result[0][1]
 
-    # Regular expression to extract variables and their values
-    regex = fr".*?([A-Za-z0-9_]+).*?[=:](.*)"
+        try:
+            post_llm_dict = validate_post_llm_answer(parse_json_reply(question_response))
+        except ValueError as e:
+            print(f"Invalid poster analysis (attempt {attempt + 1}): {e}")
+            continue
 
-    # Find all matches in the text
-    matches = re.findall(regex, question_response)
+        print(post_llm_dict)
 
-    # Loop through each match and assign them to original variables
-    for match in matches:
-        if match[0] in post_llm_dict:
-            try:
-                post_llm_dict[match[0]] = match[1].strip()
-            except:
-                pass
+        # Save to cache
+        if cache is not None:
+            cache.set(cache_key, post_llm_dict)
 
-    print(question_response)
-    print(post_llm_dict)
-    return post_llm_dict
+        return post_llm_dict
+
+    return None
 
 # Scrapes post and stores in database
+@timed("post_scraper")
 def post_scraper(driver, post_link):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
     # Open post
-    driver.get(post_link)
+    with metrics.timer("post_scraper.page_load"):
+        driver.get(post_link)
+    metrics.count("pages_loaded")
 
     # Wait for the page to load
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "discuss-thread-base")))
+    with metrics.timer("post_scraper.wait"):
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, "discuss-thread-base")))
 
     # Initialize dictionary
     post_dict = {
@@ -261,82 +599,214 @@ def post_scraper(driver, post_link):
     except (NoSuchElementException, StaleElementReferenceException):
         pass
 
-    # Save to Pandas dataframe
-    df = pd.DataFrame(post_dict)
-
     # Return post_dict
     print(f"New Post Scraped: {post_dict['title'][0]}")
     return post_dict
 
 
-# Runs gpt-4o-mini LLM to analyze post to fill in event details
-def post_llm(openai_api_key, post_dict):
-    # Define dictionary to be filled
-    post_llm_dict = {
-        "is_event": None,
-        "event_type": None,
-        "event_date": None,
-        "event_time": None,
-        "event_location": None,
-        "is_food": None,
-        "food_type": None
+# Runs gpt-4o-mini LLM to analyze post to fill in event details (returns None if no valid answer after max_llm_attempts)
+@timed("post_llm")
+def post_llm(openai_api_key, post_dict, cache=None):
+    return post_llm_batch(openai_api_key, [post_dict], cache=cache)[0]
+
+# Returns the shared OpenAI client for an API key, creating it on first use
+def get_openai_client(openai_api_key):
+    with openai_clients_lock:
+        if openai_api_key not in openai_clients:
+            # Retries are left to openai_scheduler so every thread backs off together
+            from openai import OpenAI
+            openai_clients[openai_api_key] = OpenAI(api_key=openai_api_key, max_retries=0)
+        return openai_clients[openai_api_key]
+
+# Returns this thread's Gradio client for the vision model, creating it on first use
+def get_gradio_client(hf_token):
+    clients = getattr(gradio_clients, "clients", None)
+    if clients is None:
+        clients = gradio_clients.clients = {}
+    if hf_token not in clients:
+        from gradio_client import Client
+        clients[hf_token] = Client(post_image_llm_model, hf_token=hf_token)
+    return clients[hf_token]
+
+# Wraps a local path or URL as a file argument for the Gradio client
+def gradio_file(image_path):
+    from gradio_client import handle_file
+    return handle_file(image_path)
+
+# Trims a post_dict down to the fields the LLM needs (drops the link and base64 image data)
+def post_llm_context(post_dict):
+    description = post_dict['description'][0] or ""
+    return {
+        "title": post_dict['title'][0],
+        "date_posted": post_dict['date_posted'][0],
+        "posted_by": post_dict['posted_by'][0],
+        "description": description[:max_description_length]
     }
 
-    # Initiate Client
-    client = OpenAI(
-        # This is the default and can be omitted
-        api_key=openai_api_key
-    )
-
-    # Define query
-    query = f"""
-        Context:
-        {post_dict}
-
-        Questions to Answer:
-        is_event = TRUE/FALSE
-        event_type = Meeting/Workshop/Seminar/Lecture/Social/Fair
-        event_date = <FORMAT DATE IN %d-%b-%Y FORMAT, IF YEAR IS NOT GIVEN USE YEAR GIVEN DATE POSTED>
-        event_time = <FORMAT TIME IN XX:XX AM/PM FORMAT>
-        event_location = <FILL IN LOCATION>
-        is_food = TRUE/FALSE/LIKELY (TRUE IF MENTIONED, FALSE IF NOT MENTIONED AND NOT HOSTED BY BIG COMPANY, LIKELY IF NOT MENTIONED BUT HOSTED BY BIG COMPANY, PUT LIKELY)
-        food_type = None/Not Specified/<ONE WORD ANSWER OF WHAT THE FOOD WILL BE>
-    """
-
+# Parses the first JSON object in a free-text reply (models sometimes wrap it in prose or code fences)
+def parse_json_reply(reply):
+    start = reply.find("{")
+    end = reply.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("reply has no JSON object")
     try:
-        # Create the chat completion request
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": query
-                }
-            ]
-        )
-
-        # Output the final result
-        question_response = response.choices[0].message.content
-
-        # Regular expression to extract variables and their values
-        regex = fr".*?([A-Za-z0-9_]+).*?[=:](.*)"
-
-        # Find all matches in the text
-        matches = re.findall(regex, question_response)
+        return json.loads(reply[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"reply is not valid JSON: {e}")
+
+# Checks one post's answers against the expected types and formats, returning them as a post_llm_dict
+def validate_post_llm_answer(answer):
+    if not isinstance(answer, dict):
+        raise ValueError("answer is not an object")
+    missing_keys = [key for key in post_llm_answer_properties if key not in answer]
+    if missing_keys:
+        raise ValueError(f"missing {', '.join(missing_keys)}")
+
+    # is_event: boolean (the vision model may still answer with a string)
+    is_event = answer['is_event']
+    if isinstance(is_event, str) and is_event.strip().upper() in ("TRUE", "FALSE"):
+        is_event = is_event.strip().upper() == "TRUE"
+    if not isinstance(is_event, bool):
+        raise ValueError(f"invalid is_event: {answer['is_event']!r}")
+
+    # event_type: one of the known types
+    event_type = answer['event_type']
+    if event_type is not None and event_type not in event_types:
+        raise ValueError(f"invalid event_type: {event_type!r}")
+
+    # event_date: %d-%b-%Y
+    event_date = answer['event_date']
+    if event_date is not None:
+        try:
+            event_date = datetime.strptime(str(event_date).strip(), "%d-%b-%Y").strftime("%d-%b-%Y")
+        except ValueError:
+            raise ValueError(f"invalid event_date: {event_date!r}")
+
+    # event_time: hh:mm AM/PM
+    event_time = answer['event_time']
+    if event_time is not None:
+        event_time = str(event_time).strip().upper()
+        if not re.fullmatch(r"(0?[1-9]|1[0-2]):[0-5][0-9] (AM|PM)", event_time):
+            raise ValueError(f"invalid event_time: {answer['event_time']!r}")
+
+    # is_food: TRUE/FALSE/LIKELY
+    is_food = str(answer['is_food']).strip().upper()
+    if is_food not in is_food_answers:
+        raise ValueError(f"invalid is_food: {answer['is_food']!r}")
+
+    return {
+        "is_event": "TRUE" if is_event else "FALSE",
+        "event_type": event_type,
+        "event_date": event_date,
+        "event_time": event_time,
+        "event_location": str(answer['event_location']).strip() if answer['event_location'] is not None else None,
+        "is_food": is_food,
+        "food_type": str(answer['food_type']).strip() if answer['food_type'] is not None else None
+    }
 
-        # Loop through each match and assign them to original variables
-        for match in matches:
-            if match[0] in post_llm_dict:
-                try:
-                    post_llm_dict[match[0]] = match[1].strip()
-                except:
-                    pass
+# Sends one classification request, returning the completion and the response headers (for the rate-limit counters)
+def post_llm_completion(client, query):
+    raw_response = client.chat.completions.with_raw_response.create(
+        model=post_llm_model,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "post_classifications", "strict": True, "schema": post_llm_batch_schema}
+        },
+        messages=[
+            {
+                "role": "user",
+                "content": query
+            }
+        ]
+    )
+    return raw_response.parse(), raw_response.headers
+
+# Runs gpt-4o-mini LLM on many posts in one request and returns the updated post_dicts (None for posts it failed on)
+# Replies are constrained to a JSON schema and validated, posts with invalid answers are re-sent (up to max_llm_attempts times)
+@timed("post_llm_batch")
+def post_llm_batch(openai_api_key, post_dict_list, cache=None):
+    results = [None for _ in post_dict_list]
+
+    # Check the cache first and only send the misses to the LLM
+    pending_posts = {}
+    cache_keys = {}
+    for index, post_dict in enumerate(post_dict_list):
+        context = post_llm_context(post_dict)
+        cache_keys[index] = llm_cache_key(context, post_llm_model, llm_prompt_version)
+        cached_post_llm_dict = cache.get(cache_keys[index]) if cache is not None else None
+        if cached_post_llm_dict is not None:
+            post_dict.update(cached_post_llm_dict)
+            print("Cached Post Analysis Used: ", post_dict['title'][0])
+            metrics.count("llm_cache_hits")
+            results[index] = post_dict
+        else:
+            # Key every post by its position in the batch
+            pending_posts[str(index)] = context
+            metrics.count("llm_cache_misses")
+
+    # Reuse the shared client
+    client = get_openai_client(openai_api_key)
+
+    for attempt in range(max_llm_attempts):
+        if not pending_posts:
+            break
+        if attempt:
+            metrics.count("llm_retries")
+            metrics.count("llm_retried_posts", len(pending_posts))
+
+        # Define query
+        query = f"""
+        Posts (JSON object keyed by post ID):
+        {json.dumps(pending_posts, ensure_ascii=False)}
+
+        Questions to Answer for every post:
+        {post_llm_questions}
+
+        Answer every post, tagging each answer with its post ID.
+        """
+
+        # Rough token count (about four characters per token plus each post's answer) for the token bucket
+        estimated_tokens = len(query) // 4 + 80 * len(pending_posts)
 
-        # Update post_dict with new details
-        post_dict.update(post_llm_dict)
+        try:
+            # Create the chat completion request through the shared scheduler (rate limits and transient errors are retried there)
+            with metrics.timer("post_llm.request"):
+                response = openai_scheduler.call(lambda: post_llm_completion(client, query), estimated_tokens=estimated_tokens, returns_headers=True)
+            metrics.count("llm_requests")
+            if response.usage is not None:
+                metrics.count("llm_tokens_in", response.usage.prompt_tokens)
+                metrics.count("llm_tokens_out", response.usage.completion_tokens)
+                openai_scheduler.record_tokens(estimated_tokens, response.usage.total_tokens)
+
+            # Parse the reply as JSON
+            answers = json.loads(response.choices[0].message.content)['posts']
+        except Exception as e:
+            print(f"Batch analysis failed (attempt {attempt + 1}): {e}")
+            continue
 
-        print("New Post Analyzed: ", post_dict['title'][0])
-        return post_dict
+        # Fill in each post's details from its answer, leaving invalid or missing answers pending
+        for answer in answers:
+            post_id = str(answer.get('id')) if isinstance(answer, dict) else None
+            if post_id not in pending_posts:
+                continue
 
-    except Exception as e:
-        pass
\ No newline at end of file
+            try:
+                post_llm_dict = validate_post_llm_answer(answer)
+            except ValueError as e:
+                print(f"Invalid analysis for post {post_id} (attempt {attempt + 1}): {e}")
+                continue
+
+            # Save to cache
+            index = int(post_id)
+            if cache is not None:
+                cache.set(cache_keys[index], post_llm_dict)
+
+            # Update post_dict with new details
+            post_dict = post_dict_list[index]
+            post_dict.update(post_llm_dict)
+            print("New Post Analyzed: ", post_dict['title'][0])
+            results[index] = post_dict
+            del pending_posts[post_id]
+
+    metrics.count("llm_failed_posts", len(pending_posts))
+    return results
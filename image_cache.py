@@ -0,0 +1,79 @@
+from requests.adapters import HTTPAdapter
+import mimetypes
+import threading
+import requests
+import hashlib
+import base64
+import json
+import os
+import re
+
+# Inline data URIs that hold raster images (SVG data URIs are EdStem's file/link icons, not posters)
+raster_data_uri_regex = re.compile(r"^data:image/(png|jpeg|jpg|gif|webp);base64,(.*)$", re.DOTALL)
+
+# Checks whether a post's image_url points at a real poster worth sending to the vision model
+def is_poster_url(image_url):
+    if not image_url:
+        return False
+    if image_url.startswith("data:"):
+        return raster_data_uri_regex.match(image_url) is not None
+    return image_url.startswith("http://") or image_url.startswith("https://")
+
+# Local content-hashed store of downloaded poster images, so each image is only downloaded once
+class ImageCache:
+    def __init__(self, cache_dir="image_cache", pool_size=8, timeout=15):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Map of image URL hash to the cached file name, persisted next to the images
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path, 'r') as file:
+                self.index = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+
+        # Keep-alive connection pool for downloads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # Downloads (or decodes) an image, returning its bytes and file extension
+    def download(self, image_url):
+        data_uri_match = raster_data_uri_regex.match(image_url)
+        if data_uri_match is not None:
+            return base64.b64decode(data_uri_match.group(2)), "." + data_uri_match.group(1).replace("jpeg", "jpg")
+
+        response = self.session.get(image_url, timeout=self.timeout)
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        return response.content, mimetypes.guess_extension(content_type) or ".img"
+
+    # Returns the local path of a poster image, downloading it the first time it is seen
+    def get(self, image_url):
+        url_hash = hashlib.sha256(image_url.encode("utf-8")).hexdigest()
+        with self.lock:
+            file_name = self.index.get(url_hash)
+        if file_name is not None and os.path.exists(os.path.join(self.cache_dir, file_name)):
+            return os.path.join(self.cache_dir, file_name)
+
+        # Name the file after its content so the same poster posted under different URLs is stored once
+        content, extension = self.download(image_url)
+        file_name = hashlib.sha256(content).hexdigest() + extension
+        path = os.path.join(self.cache_dir, file_name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.write(content)
+
+        with self.lock:
+            self.index[url_hash] = file_name
+            with open(self.index_path, 'w') as file:
+                json.dump(self.index, file)
+        return path
+
+    # Returns the content hash of a cached image (its file name without the extension)
+    def content_hash(self, path):
+        return os.path.splitext(os.path.basename(path))[0]
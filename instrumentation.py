@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+from datetime import datetime
+import functools
+import math
+import threading
+import json
+import time
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+# Per-stage timers and run counters shared by every thread (and the crawler's event loop) in a run
+class Metrics:
+    def __init__(self, max_spans=100000):
+        self.lock = threading.Lock()
+        self.max_spans = max_spans  # Spans kept for the trace, stage timings are always kept
+        self.reset()
+
+    # Starts a new run
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.start = time.perf_counter()
+            self.durations = {}
+            self.counters = {}
+            self.spans = []
+            self.dropped_spans = 0
+
+    # Records how long one call of a stage took (seconds)
+    def record(self, stage, duration, start=None, error=None):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(duration)
+            if len(self.spans) < self.max_spans:
+                span = {
+                    "stage": stage,
+                    "start": round((start if start is not None else time.perf_counter() - duration) - self.start, 6),
+                    "duration": round(duration, 6),
+                    "thread": threading.current_thread().name
+                }
+                if error is not None:
+                    span["error"] = type(error).__name__
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    # Times the block as one call of a stage, failed calls are timed too and marked in the trace
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.record(stage, time.perf_counter() - start, start, error=e)
+            self.count(f"{stage}.errors")
+            raise
+        self.record(stage, time.perf_counter() - start, start)
+
+    # Adds to a counter (pages loaded, LLM tokens, cache hits, retries, skipped links...)
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Per-stage call count, total, mean, p50, p95 and max (seconds)
+    def stage_stats(self):
+        with self.lock:
+            durations = {stage: sorted(values) for stage, values in self.durations.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "max": values[-1]
+            }
+            for stage, values in durations.items()
+        }
+
+    # Prints the end-of-run report
+    def summary(self):
+        stage_stats = self.stage_stats()
+        with self.lock:
+            counters = dict(self.counters)
+        elapsed = time.perf_counter() - self.start
+
+        print(f"Run Summary ({elapsed:.1f}s):")
+        if stage_stats:
+            print(f"  {'Stage':<32}{'Calls':>8}{'Total (s)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}{'Max (ms)':>12}")
+            for stage, stats in sorted(stage_stats.items()):
+                print(f"  {stage:<32}{stats['count']:>8}{stats['total']:>12.2f}{stats['p50'] * 1000:>12.1f}{stats['p95'] * 1000:>12.1f}{stats['max'] * 1000:>12.1f}")
+        for name, value in sorted(counters.items()):
+            print(f"  {name}: {value}")
+
+    # Writes the run as JSON (stage stats, counters and individual spans) so runs can be compared
+    def write_trace(self, path="run_trace.json"):
+        stage_stats = self.stage_stats()
+        with self.lock:
+            trace = {
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+                "elapsed": time.perf_counter() - self.start,
+                "stages": stage_stats,
+                "counters": dict(self.counters),
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans
+            }
+        with open(path, 'w') as file:
+            json.dump(trace, file, indent=1)
+        print(f"Run trace saved to {path}")
+
+# Metrics for the current run
+metrics = Metrics()
+
+# Decorator that times every call of a function as a stage
+def timed(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
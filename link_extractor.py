@@ -0,0 +1,85 @@
+from html.parser import HTMLParser
+import codecs
+
+# lxml's pull parser is much faster when it is installed, otherwise fall back to the standard library tokenizer
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Start of every EdStem course join link
+edstem_join_prefix = "https://edstem.org/us/join/"
+
+# Standard library tokenizer that only records <a href> values
+class HrefParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.hrefs.append(value)
+
+# Extracts <a href> values from an HTML body fed in chunks, returning the new hrefs after every chunk
+class LinkStream:
+    def __init__(self, use_lxml=True):
+        self.use_lxml = use_lxml and etree is not None
+        if self.use_lxml:
+            self.parser = etree.HTMLPullParser(events=("start",), tag="a")
+        else:
+            self.parser = HrefParser()
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    # Collects the hrefs the parser has found since the last call
+    def read_hrefs(self):
+        if self.use_lxml:
+            hrefs = []
+            for _, element in self.parser.read_events():
+                href = element.get("href")
+                if href:
+                    hrefs.append(href)
+            return hrefs
+
+        hrefs = self.parser.hrefs
+        self.parser.hrefs = []
+        return hrefs
+
+    # Feeds the next chunk of the body (bytes) and returns the hrefs it completed
+    def feed(self, chunk):
+        if self.use_lxml:
+            self.parser.feed(chunk)
+        else:
+            self.parser.feed(self.decoder.decode(chunk))
+        return self.read_hrefs()
+
+    # Finishes the body and returns any remaining hrefs
+    def close(self):
+        if self.use_lxml:
+            try:
+                self.parser.close()
+            except etree.XMLSyntaxError:
+                pass
+        else:
+            self.parser.feed(self.decoder.decode(b"", final=True))
+            self.parser.close()
+        return self.read_hrefs()
+
+# Yields hrefs from an iterable of byte chunks as soon as each one is parsed
+def iter_links(chunks, use_lxml=True):
+    link_stream = LinkStream(use_lxml=use_lxml)
+    for chunk in chunks:
+        yield from link_stream.feed(chunk)
+    yield from link_stream.close()
+
+# Returns every href in a complete HTML body
+def extract_links(content, use_lxml=True):
+    return list(iter_links([content], use_lxml=use_lxml))
+
+# Returns the first EdStem join link in a body fed in chunks, reading no further than needed
+def find_edstem_link(chunks, use_lxml=True):
+    for href in iter_links(chunks, use_lxml=use_lxml):
+        if href.startswith(edstem_join_prefix):
+            return href
+    return None
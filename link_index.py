@@ -0,0 +1,111 @@
+from array import array
+import threading
+import bisect
+import struct
+import os
+import re
+
+# Matches EdStem post links (edstem.org/us/... or us.edstem.org/...), ignoring anything around them such as list-repr quotes or "\n"
+edstem_link_regex = re.compile(r"edstem\.org/(?:us/)?courses/(\d+)/discussion/(\d+)")
+
+# Parses an EdStem post link into (course_id, thread_id) integers
+def parse_edstem_link(url):
+    match = edstem_link_regex.search(url)
+    if match is None:
+        raise ValueError(f"Not an EdStem post link: {url!r}")
+    return int(match.group(1)), int(match.group(2))
+
+# Builds the canonical link for a post
+def canonical_edstem_link(course_id, thread_id):
+    return f"https://edstem.org/us/courses/{course_id}/discussion/{thread_id}"
+
+# Rewrites any form of an EdStem post link into its canonical form
+def normalize_edstem_link(url):
+    return canonical_edstem_link(*parse_edstem_link(url))
+
+# Compact index of known posts: one sorted array of 64-bit thread IDs per course (8 bytes per post)
+class LinkIndex:
+    def __init__(self, path="link_index.bin"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.courses = {}
+
+    # Checks whether a post link is already known
+    def contains(self, url):
+        course_id, thread_id = parse_edstem_link(url)
+        with self.lock:
+            thread_ids = self.courses.get(course_id)
+            if thread_ids is None:
+                return False
+            position = bisect.bisect_left(thread_ids, thread_id)
+            return position < len(thread_ids) and thread_ids[position] == thread_id
+
+    # Adds a post link, returning True if it was not known before
+    def add(self, url):
+        course_id, thread_id = parse_edstem_link(url)
+        with self.lock:
+            thread_ids = self.courses.setdefault(course_id, array('q'))
+            position = bisect.bisect_left(thread_ids, thread_id)
+            if position < len(thread_ids) and thread_ids[position] == thread_id:
+                return False
+            thread_ids.insert(position, thread_id)
+            return True
+
+    # Number of known posts
+    def __len__(self):
+        with self.lock:
+            return sum(len(thread_ids) for thread_ids in self.courses.values())
+
+    # Writes the index as (course_id, count) headers followed by the sorted thread IDs, replacing the file atomically
+    def save(self):
+        temporary_path = self.path + ".tmp"
+        with self.lock:
+            with open(temporary_path, 'wb') as file:
+                for course_id, thread_ids in sorted(self.courses.items()):
+                    file.write(struct.pack("<qq", course_id, len(thread_ids)))
+                    file.write(thread_ids.tobytes())
+        os.replace(temporary_path, self.path)
+
+    # Reads a saved index (returns False if there is no file yet)
+    def load(self):
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return False
+
+        courses = {}
+        offset = 0
+        while offset < len(data):
+            course_id, count = struct.unpack_from("<qq", data, offset)
+            offset += 16
+            thread_ids = array('q')
+            thread_ids.frombytes(data[offset:offset + 8 * count])
+            offset += 8 * count
+            courses[course_id] = thread_ids
+
+        with self.lock:
+            self.courses = courses
+        return True
+
+    # Loads the saved index, or builds it from every link in the event store and work queue on the first run
+    @classmethod
+    def load_or_build(cls, path, store):
+        link_index = cls(path)
+        if link_index.load():
+            return link_index
+
+        print("Building link index...")
+        with store.lock:
+            links = [row[0] for row in store.connection.execute("SELECT post_link FROM posts")]
+            if store.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'link_queue'").fetchone():
+                links += [row[0] for row in store.connection.execute("SELECT post_link FROM link_queue")]
+        for link in links:
+            try:
+                link_index.add(link)
+            except ValueError:
+                pass
+
+        link_index.save()
+        print(f"Link index built with {len(link_index)} posts!")
+        return link_index
@@ -0,0 +1,104 @@
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+import re
+
+# Builds the cache key for an LLM call from the normalized post content, model name and prompt version
+def llm_cache_key(content, model, prompt_version):
+    # Collapse whitespace so cosmetic differences in scraped text still hit the cache
+    if isinstance(content, str):
+        normalized_content = re.sub(r"\s+", " ", content).strip()
+    else:
+        normalized_content = {key: re.sub(r"\s+", " ", value).strip() if isinstance(value, str) else value for key, value in content.items()}
+
+    key_source = json.dumps({"model": model, "prompt_version": prompt_version, "content": normalized_content}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+# Counts the entries in a cache file without opening it for writing (0 when there is no cache yet)
+def count_cache_entries(path):
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return 0
+    try:
+        return connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        connection.close()
+
+# Persistent SQLite cache of parsed LLM results (post_llm_dicts) with size and age based eviction
+class LLMCache:
+    def __init__(self, path="llm_cache.db", max_entries=50000, max_age_days=180):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+
+        # Hit/miss counters for the current run
+        self.hits = 0
+        self.misses = 0
+
+        # One connection shared by every worker thread, guarded by a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used_at ON llm_cache (last_used_at)")
+        self.connection.commit()
+
+        # Drop stale entries on startup
+        self.evict()
+
+    # Returns the cached post_llm_dict for a key, or None on a miss
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+
+            # Expired entries count as misses
+            if row is None or time.time() - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+
+            self.connection.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    # Stores a post_llm_dict under a key
+    def set(self, key, post_llm_dict):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(post_llm_dict), now, now)
+            )
+            self.connection.commit()
+
+    # Removes entries older than max_age_days, then the least recently used entries beyond max_entries
+    def evict(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            self.connection.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.connection.commit()
+
+    # Returns the hit/miss counters and number of stored entries
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,15 +1,3 @@
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from datetime import datetime
-from functions import *
-import pandas as pd
-import time
-
 # CalNet Credentials
 user = ""
 user_email = ""
@@ -21,64 +9,206 @@ hf_token = ""
 # OpenAI API Key
 openai_api_key = ""
 
-# Open events_database.csv and rejected_database.csv or reference
-events_db_df = pd.read_csv("events_database.csv")
-rejected_db_df = pd.read_csv("rejected_database.csv")
-events_db_links_set = set(events_db_df.iloc[:,0])
-rejected_db_links_set = set(rejected_db_df.iloc[:,0])
-db_links_set = events_db_links_set | rejected_db_links_set
-db_links_set = {item.strip("[]'\\n") for item in db_links_set}
-
-# Initialize Selenium WebDriver
-chrome_options = Options()
-driver = webdriver.Chrome(options=chrome_options)
-
-# Login to EdStem
-edstem_login(driver, user, user_email, user_password)
-
-# # Access threads_database.csv as list
-# thread_dict_list = threads_database_parser()
-#
-# # Loop through all threads and adds links to new_post_links.txt
-# for thread_dict in thread_dict_list:
-#     dept_edstem_thread_scraper(driver, thread_dict)
-
-# Scrape every single post from new_post_links.txt
-with open('new_post_links.txt', 'r') as file:
-    # Loop through each line (link) in the file
-    for link in file:
-        # Strip newline
-        link = link.strip()
-        # Check if link already exists in our database
-        if link not in db_links_set:
+# Scrape department threads for new post links before processing them
+scrape_threads = False
+thread_scrape_workers = 4
+
+# Pipeline settings (set use_pipeline to False to process one link at a time)
+use_pipeline = True
+scrape_workers = 8
+llm_workers = 4
+llm_batch_size = 10
+
+# Also read posters with the vision model (posts without a poster skip it)
+use_image_llm = False
+vision_workers = 2
+
+# Reuse the classification of posts cross-posted in several threads instead of sending every copy to the LLM
+use_duplicate_index = True
+
+# Skip obvious non-events with the local pre-classifier (train it first with: python prefilter.py train)
+use_prefilter = False
+
+# Fetch posts through the EdStem JSON API (Selenium is still used as a fallback)
+use_api_fetcher = True
+driver_pool_size = 2
+
+# Give links that failed too many times another round of attempts
+requeue_failed_links = False
+
+# Reuse the last EdStem login (saved encrypted, key in edstem_session.key or EDSTEM_SESSION_KEY) and a persistent Chrome profile
+use_saved_session = True
+chrome_profile_dir = "chrome_profile"
+
+# Heavy modules (Selenium, OpenAI, gradio) are imported inside the steps that use them, so importing main stays cheap
+
+# Opens the event store (imports events_database.csv and rejected_database.csv on first run) and the index of every post link already seen
+def open_store():
+    from event_store import EventStore
+    from link_index import LinkIndex
+
+    store = EventStore("events.db")
+    store.migrate_from_csv("events_database.csv", "rejected_database.csv")
+
+    # Compact index of every post link already seen, so duplicates are dropped as soon as they are scraped
+    link_index = LinkIndex.load_or_build("link_index.bin", store)
+    return store, link_index
+
+# Starts Chrome and logs in to EdStem (only needs CalNet and Duo when the saved session has expired)
+def login():
+    from functions import create_driver, edstem_login
+    from session_store import SessionStore
+
+    driver = create_driver(profile_dir=chrome_profile_dir if use_saved_session else None)
+    session_store = SessionStore("edstem_session.bin") if use_saved_session else None
+    edstem_login(driver, user, user_email, user_password, session_store=session_store)
+    return driver
+
+# Scrapes all department threads concurrently and adds new links to new_post_links.txt (only posts newer than each thread's last run)
+def scrape_threads_step(driver, link_index, max_workers=None):
+    from functions import threads_database_parser, threads_database_writer
+    from thread_scheduler import scrape_threads_parallel
+
+    # Access threads_database.csv as list
+    thread_dict_list = threads_database_parser()
+
+    scrape_threads_parallel(driver, thread_dict_list, max_workers=max_workers or thread_scrape_workers, incremental=True, link_index=link_index)
+
+    # Save each thread's newest post ID for the next incremental run
+    threads_database_writer(thread_dict_list)
+
+# Moves new links into the durable work queue (resuming anything a previous run left in flight)
+def fill_work_queue(store, link_index, requeue_failed=None):
+    from work_queue import WorkQueue
+
+    work_queue = WorkQueue(store, link_index=link_index)
+    work_queue.recover()
+    if requeue_failed_links if requeue_failed is None else requeue_failed:
+        work_queue.requeue_failed()
+    work_queue.import_links_file('new_post_links.txt')
+    link_index.save()
+    return work_queue
+
+# Scrapes, analyzes and stores every pending post in the work queue
+def process_posts(driver, store, work_queue, llm_cache, pipeline=None):
+    from functions import create_driver, copy_session_cookies, post_llm
+    from pipeline import run_pipeline, scrape_post, read_poster
+    from edstem_api import create_edstem_session
+    from image_cache import ImageCache
+    from duplicate_index import DuplicateIndex
+    from instrumentation import metrics
+    from queue import Queue
+
+    # Similarity index of classified posts for catching cross-posts (signatures are saved in the event store)
+    duplicate_index = DuplicateIndex(store) if use_duplicate_index else None
+
+    # Reuse the logged in session for direct API fetches
+    session = create_edstem_session(driver, pool_size=scrape_workers) if use_api_fetcher else None
+
+    # Local cache of downloaded posters for the vision model
+    image_cache = ImageCache("image_cache") if use_image_llm else None
+
+    # Load the trained pre-classifier
+    prefilter = None
+    if use_prefilter:
+        from prefilter import PreClassifier
+        prefilter = PreClassifier.load()
+
+    if use_pipeline if pipeline is None else pipeline:
+        # Create extra drivers that share the logged in session
+        driver_pool = [driver]
+        for _ in range(driver_pool_size - 1):
+            worker_driver = create_driver()
+            copy_session_cookies(driver, worker_driver)
+            driver_pool.append(worker_driver)
+
+        # Scrape, analyze and store posts concurrently
+        run_pipeline(driver_pool, openai_api_key, work_queue, session=session, scrape_workers=scrape_workers, llm_workers=llm_workers, llm_batch_size=llm_batch_size, cache=llm_cache, prefilter=prefilter,
+                     hf_token=hf_token if use_image_llm else None, vision_workers=vision_workers, image_cache=image_cache,
+                     duplicate_index=duplicate_index)
+
+        # Close the extra drivers
+        for worker_driver in driver_pool[1:]:
+            worker_driver.quit()
+        return
+
+    # Single driver pool for the Selenium fallback
+    driver_queue = Queue()
+    driver_queue.put(driver)
+
+    # Take one link at a time from the queue
+    while True:
+        links = work_queue.claim(1)
+        if not links:
+            break
+        link = links[0]
+
+        try:
             # Scrape post details as a dict
-            post_dict = post_scraper(driver, link)
-
-            # Evaluates post details and uses LLM to fill in fields
-            post_llm_dict = post_llm(openai_api_key, post_dict)
-
-            # Evaluates if post is an event and adds to respective database
-            if post_llm_dict['is_event'] == "TRUE":
-                # Add dictionary to events_database.csv
-                with open("events_database.csv", mode='a', newline='', encoding='utf-8') as file:
-                    writer = csv.DictWriter(file, fieldnames = post_llm_dict.keys())
-
-                    # Add dict to database
-                    writer.writerow(post_llm_dict)
-                    print(f"Successfuly Added Event to events_database: {post_llm_dict['title']}")
-            else:
-                # Add dictionary to rejected_database.csv
-                with open("rejected_database.csv", mode='a', newline='', encoding='utf-8') as file:
-                    writer = csv.DictWriter(file, fieldnames=post_llm_dict.keys())
-
-                    # Add dict to database
-                    writer.writerow(post_llm_dict)
-                    print(f"Successfuly Added Post to rejected_database: {post_llm_dict['title']}")
+            post_dict = scrape_post(session, driver_queue, link)
+
+            # Cross-posts reuse the earlier classification
+            post_llm_dict = duplicate_index.classify_duplicate(post_dict) if duplicate_index is not None else None
+
+            # Obvious non-events are rejected locally, other posts are evaluated by the LLM
+            if post_llm_dict is None and prefilter is not None:
+                rejected_posts, _ = prefilter.split([post_dict])
+                if rejected_posts:
+                    metrics.count("prefilter_skipped")
+                    post_llm_dict = rejected_posts[0]
+            if post_llm_dict is None:
+                post_llm_dict = post_llm(openai_api_key, post_dict, cache=llm_cache)
+
+            # Complete event details from the poster
+            if post_llm_dict is not None and use_image_llm:
+                read_poster(hf_token, post_llm_dict, cache=llm_cache, image_cache=image_cache)
+        except Exception as e:
+            print(f"Failed to process {link}: {e}")
+            work_queue.fail(link, e)
+            continue
+
+        # Evaluates if post is an event and adds to respective database (marking the link done in the same transaction)
+        if post_llm_dict is not None:
+            work_queue.complete([post_llm_dict])
+            # Only stored posts are indexed, so later cross-posts never point at a post that was not saved
+            if duplicate_index is not None:
+                duplicate_index.add(post_llm_dict)
         else:
-            print(f"Currently Existing Link Skipped: {link}")
+            work_queue.fail(link, "no valid LLM answer")
+
+# Reports how much the LLM cache saved, the queue and scheduler state, and where the run spent its time
+def report(llm_cache, work_queue, trace_path="run_trace.json"):
+    from functions import openai_scheduler, hf_scheduler
+    from instrumentation import metrics
+
+    print(f"LLM Cache Stats: {llm_cache.stats()}")
+    print(f"Work Queue: {work_queue.counts()}")
+    print(f"OpenAI Scheduler: {openai_scheduler.stats()}")
+    if use_image_llm:
+        print(f"Hugging Face Scheduler: {hf_scheduler.stats()}")
+
+    # Save the trace for comparing runs
+    metrics.summary()
+    metrics.write_trace(trace_path)
+
+def main():
+    from llm_cache import LLMCache
 
-# Clear new_post_links.txt
-with open('new_post_links.txt', 'w') as file:
-    pass
+    # Persistent cache of LLM results so re-processed posts are not paid for twice
+    llm_cache = LLMCache("llm_cache.db")
+    store, link_index = open_store()
+    driver = login()
+    try:
+        if scrape_threads:
+            scrape_threads_step(driver, link_index)
 
+        work_queue = fill_work_queue(store, link_index)
+        process_posts(driver, store, work_queue, llm_cache)
+        report(llm_cache, work_queue)
+    finally:
+        driver.quit()
+        llm_cache.close()
+        store.close()
 
+if __name__ == "__main__":
+    main()
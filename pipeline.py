@@ -0,0 +1,308 @@
+from threading import Thread, Event
+from queue import Queue, Empty, Full
+from functions import *
+from edstem_api import post_fetcher
+from image_cache import is_poster_url
+import traceback
+
+# Sentinel placed on a queue to tell the next stage that no more items are coming
+STAGE_DONE = object()
+
+# Puts an item on a stage queue, giving up (returning False) once the pipeline is stopping and the queue stays full
+# Items dropped this way keep their links in flight, so the work queue resumes them on the next run
+def put_item(queue, item, stopped):
+    while True:
+        try:
+            queue.put(item, timeout=0.5)
+            return True
+        except Full:
+            if stopped.is_set():
+                return False
+
+# Gets an item from a stage queue, treating an empty queue as the end of the stage once the pipeline is stopping
+def get_item(queue, stopped):
+    while True:
+        try:
+            return queue.get(timeout=0.5)
+        except Empty:
+            if stopped.is_set():
+                return STAGE_DONE
+
+# Runs a stage worker, stopping the whole pipeline if it dies so the other stages and the feeder do not wait on it forever
+def run_stage(stage, target, args, stopped):
+    try:
+        target(*args)
+    except Exception:
+        traceback.print_exc()
+        print(f"{stage} worker crashed, stopping the pipeline (unfinished links are resumed on the next run)")
+        stopped.set()
+
+# Marks the links of posts as failed, so one bad batch is retried later instead of staying in flight
+def fail_posts(work_queue, post_dict_list, error):
+    for post_dict in post_dict_list:
+        try:
+            work_queue.fail(post_dict['post_link'][0], error)
+        except Exception as e:
+            print(f"Could not record failure of {post_dict['post_link'][0]}: {e}")
+
+# Gets a post_dict through the EdStem API, falling back to a Selenium page load from the driver pool
+# Without a driver pool (driver_queue is None) an API failure is raised instead of waiting for a driver that never comes
+def scrape_post(session, driver_queue, link):
+    # Fast path: fetch the thread JSON over the pooled HTTP session
+    if session is not None:
+        try:
+            return post_fetcher(session, link)
+        except Exception as e:
+            if driver_queue is None:
+                raise
+            print(f"API fetch failed for {link}, falling back to Selenium: {e}")
+            metrics.count("api_fallbacks")
+
+    # Slow path: borrow a driver from the pool and load the page
+    driver = driver_queue.get()
+    try:
+        return post_scraper(driver, link)
+    finally:
+        driver_queue.put(driver)
+
+# Scrape stage: each worker turns links into post_dicts
+def scrape_worker(session, driver_queue, link_queue, post_queue, work_queue, stopped):
+    while True:
+        link = get_item(link_queue, stopped)
+        if link is STAGE_DONE:
+            break
+
+        try:
+            post_dict = scrape_post(session, driver_queue, link)
+        except Exception as e:
+            print(f"Failed to scrape {link}: {e}")
+            work_queue.fail(link, e)
+            continue
+
+        # Blocks when the LLM stage is behind (backpressure)
+        put_item(post_queue, post_dict, stopped)
+
+# Collects up to batch_size items from the queue, waiting at most batch_wait seconds for more after the first
+def next_post_batch(post_queue, batch_size, batch_wait, stopped):
+    batch = []
+    finished = False
+
+    # Block for the first post
+    post_dict = get_item(post_queue, stopped)
+    if post_dict is STAGE_DONE:
+        return batch, True
+    batch.append(post_dict)
+
+    # Top the batch up with whatever arrives shortly after
+    while len(batch) < batch_size:
+        try:
+            post_dict = post_queue.get(timeout=batch_wait)
+        except Empty:
+            break
+        if post_dict is STAGE_DONE:
+            finished = True
+            break
+        batch.append(post_dict)
+
+    return batch, finished
+
+# Classifies one batch, returning (post_llm_dicts for the next stage, (post_dict, reason) pairs that failed)
+# Near-duplicates reuse their canonical post's classification and obvious non-events are rejected locally, so neither reaches the LLM
+def classify_batch(openai_api_key, batch, cache, prefilter, duplicate_index):
+    results = []
+    failures = []
+
+    # Cross-posts of an already classified post reuse its classification
+    if duplicate_index is not None:
+        duplicate_posts, batch = duplicate_index.split(batch)
+        metrics.count("duplicates_skipped", len(duplicate_posts))
+        results.extend(duplicate_posts)
+
+    # Obvious non-events are rejected locally and never reach the LLM
+    if prefilter is not None and batch:
+        rejected_posts, batch = prefilter.split(batch)
+        metrics.count("prefilter_skipped", len(rejected_posts))
+        results.extend(rejected_posts)
+
+    if not batch:
+        return results, failures
+
+    # Copies of a post within this batch wait for its answer instead of being sent as well
+    copies = []
+    if duplicate_index is not None:
+        batch, copies = duplicate_index.group(batch)
+        metrics.count("duplicates_skipped", len(copies))
+
+    post_llm_dict_list = post_llm_batch(openai_api_key, batch, cache=cache)
+    answers = {}
+    for post_dict, post_llm_dict in zip(batch, post_llm_dict_list):
+        # Posts the LLM failed on are retried later with backoff
+        if post_llm_dict is None:
+            print(f"Failed to analyze {post_dict['post_link'][0]}")
+            failures.append((post_dict, "no valid LLM answer"))
+            continue
+
+        answers[post_dict['post_link'][0]] = post_llm_dict
+        results.append(post_llm_dict)
+
+    for post_dict, representative in copies:
+        post_llm_dict = answers.get(representative['post_link'][0])
+        if post_llm_dict is None:
+            failures.append((post_dict, "no valid LLM answer"))
+            continue
+        results.append(duplicate_index.copy_classification(post_dict, representative['post_link'][0], post_llm_dict))
+    return results, failures
+
+# LLM stage: each worker classifies batches of scraped posts (a batch that raises is failed as a whole and the worker carries on)
+def llm_worker(openai_api_key, post_queue, result_queue, batch_size, batch_wait, cache, prefilter, work_queue, duplicate_index, stopped):
+    finished = False
+    while not finished:
+        batch, finished = next_post_batch(post_queue, batch_size, batch_wait, stopped)
+        if not batch:
+            break
+
+        try:
+            results, failures = classify_batch(openai_api_key, batch, cache, prefilter, duplicate_index)
+        except Exception as e:
+            print(f"Failed to analyze batch of {len(batch)} posts: {e}")
+            fail_posts(work_queue, batch, e)
+            continue
+
+        for post_dict, reason in failures:
+            fail_posts(work_queue, [post_dict], reason)
+        for post_llm_dict in results:
+            put_item(result_queue, post_llm_dict, stopped)
+
+# Fills the fields the text LLM left empty with the vision model's answers
+def merge_image_llm_dict(post_llm_dict, image_llm_dict):
+    for key, value in image_llm_dict.items():
+        current_value = post_llm_dict.get(key)
+        if value and (current_value is None or str(current_value).strip().upper() in ("", "NONE", "NOT SPECIFIED")):
+            post_llm_dict[key] = value
+    return post_llm_dict
+
+# Completes an event's details from its poster with the vision model (posts that are not events or have no real poster are returned unchanged)
+def read_poster(hf_token, post_llm_dict, cache=None, image_cache=None):
+    # Only events need their details completed from the poster
+    image_url = post_llm_dict['image_url'][0]
+    if post_llm_dict['is_event'] == "TRUE" and is_poster_url(image_url):
+        try:
+            post_text = json.dumps(post_llm_context(post_llm_dict), ensure_ascii=False)
+            image_llm_dict = post_image_llm(hf_token, post_text, image_url, cache=cache, image_cache=image_cache)
+            if image_llm_dict is not None:
+                merge_image_llm_dict(post_llm_dict, image_llm_dict)
+        except Exception as e:
+            # The text classification is still usable without the poster
+            print(f"Failed to analyze poster for {post_llm_dict['post_link'][0]}: {e}")
+    return post_llm_dict
+
+# Vision stage (optional): events with a real poster are also read by the vision model, the rest pass straight through
+def vision_worker(hf_token, vision_queue, result_queue, cache, image_cache, stopped):
+    while True:
+        post_llm_dict = get_item(vision_queue, stopped)
+        if post_llm_dict is STAGE_DONE:
+            break
+
+        put_item(result_queue, read_poster(hf_token, post_llm_dict, cache, image_cache), stopped)
+
+# Database stage: a single writer so every post lands in the event store exactly once
+def database_writer(result_queue, work_queue, batch_size, batch_wait, duplicate_index, stopped):
+    finished = False
+    while not finished:
+        # Group results so each transaction stores several posts and marks their links done together
+        batch, finished = next_post_batch(result_queue, batch_size, batch_wait, stopped)
+        if not batch:
+            continue
+
+        # A batch that cannot be stored is retried later rather than stopping the writer
+        try:
+            work_queue.complete(batch)
+        except Exception as e:
+            print(f"Failed to store batch of {len(batch)} posts: {e}")
+            fail_posts(work_queue, batch, e)
+            continue
+
+        # Stored posts are indexed so later cross-posts of them skip the LLM
+        if duplicate_index is not None:
+            for post_llm_dict in batch:
+                duplicate_index.add(post_llm_dict)
+
+# Runs scraping, LLM classification, optional poster analysis and database writes as separate concurrent stages
+def run_pipeline(driver_pool, openai_api_key, work_queue, session=None, scrape_workers=None, llm_workers=4, llm_batch_size=10, llm_batch_wait=2, cache=None, prefilter=None, hf_token=None, vision_workers=2, image_cache=None, queue_size=16, duplicate_index=None):
+    # Bounded queues between the stages provide backpressure (the post queue holds enough for every LLM worker to fill a batch)
+    link_queue = Queue(maxsize=queue_size)
+    post_queue = Queue(maxsize=max(queue_size, llm_workers * llm_batch_size))
+    result_queue = Queue(maxsize=queue_size)
+
+    # The vision stage only runs when a Hugging Face token is given
+    use_vision = hf_token is not None
+    vision_queue = Queue(maxsize=queue_size) if use_vision else result_queue
+
+    # Set when a worker crashes, so the feeder stops claiming links and no stage waits on a dead one
+    stopped = Event()
+
+    if session is None and not driver_pool:
+        raise ValueError("run_pipeline needs an EdStem API session or at least one driver")
+
+    # Drivers are shared through a queue so any scrape worker can borrow one for the Selenium fallback (None when there are none)
+    driver_queue = None
+    if driver_pool:
+        driver_queue = Queue()
+        for driver in driver_pool:
+            driver_queue.put(driver)
+
+    # Without an API session every scrape needs a driver, so default to one worker per driver
+    if scrape_workers is None:
+        scrape_workers = len(driver_pool) if session is None else 8
+
+    # Start the scrape workers
+    scrape_threads = [Thread(target=run_stage, args=("Scrape", scrape_worker, (session, driver_queue, link_queue, post_queue, work_queue, stopped), stopped)) for _ in range(scrape_workers)]
+
+    # Start the LLM workers
+    llm_threads = [Thread(target=run_stage, args=("LLM", llm_worker, (openai_api_key, post_queue, vision_queue, llm_batch_size, llm_batch_wait, cache, prefilter, work_queue, duplicate_index, stopped), stopped)) for _ in range(llm_workers)]
+
+    # Start the vision workers
+    vision_threads = []
+    if use_vision:
+        vision_threads = [Thread(target=run_stage, args=("Vision", vision_worker, (hf_token, vision_queue, result_queue, cache, image_cache, stopped), stopped)) for _ in range(vision_workers)]
+
+    # Start the database writer
+    writer_thread = Thread(target=run_stage, args=("Database", database_writer, (result_queue, work_queue, llm_batch_size, llm_batch_wait, duplicate_index, stopped), stopped))
+
+    for thread in scrape_threads + llm_threads + vision_threads + [writer_thread]:
+        thread.start()
+
+    # Feed pending links from the durable queue until none are due (claimed links are marked in flight)
+    claimed_links = 0
+    while not stopped.is_set():
+        links = work_queue.claim(queue_size)
+        if not links:
+            break
+        for link in links:
+            put_item(link_queue, link, stopped)
+        claimed_links += len(links)
+
+    # Shut the stages down in order, letting each one drain before the next is told to stop
+    # (after a crash the sentinels may be dropped, the remaining workers then stop once their queue is empty)
+    for _ in scrape_threads:
+        put_item(link_queue, STAGE_DONE, stopped)
+    for thread in scrape_threads:
+        thread.join()
+
+    for _ in llm_threads:
+        put_item(post_queue, STAGE_DONE, stopped)
+    for thread in llm_threads:
+        thread.join()
+
+    for _ in vision_threads:
+        put_item(vision_queue, STAGE_DONE, stopped)
+    for thread in vision_threads:
+        thread.join()
+
+    put_item(result_queue, STAGE_DONE, stopped)
+    writer_thread.join()
+
+    if stopped.is_set():
+        print(f"Pipeline stopped after a worker crashed, {work_queue.counts()['in_flight']} links are left in flight for the next run")
+
+    print(f"Pipeline finished processing {claimed_links} links! Queue: {work_queue.counts()}")
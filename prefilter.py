@@ -0,0 +1,150 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import make_pipeline
+from event_store import EventStore
+import numpy as np
+import argparse
+import pickle
+
+# Where the trained pre-classifier is saved
+prefilter_model_path = "prefilter.pkl"
+
+# Builds the text the pre-classifier reads from a post_dict (one-element lists) or an event store row (plain values)
+def prefilter_text(post):
+    parts = []
+    for key in ("title", "posted_by", "description"):
+        value = post.get(key)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value:
+            parts.append(value)
+    return "\n".join(parts)
+
+# Loads labeled texts from the event store (events are 1, rejected posts are 0)
+def load_training_data(store):
+    posts = store.posts()
+    texts = [prefilter_text(post) for post in posts]
+    labels = np.array([post['is_event'] for post in posts])
+    return texts, labels
+
+# Creates the TF-IDF + logistic regression model
+def create_model():
+    return make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), min_df=2, max_features=50000, sublinear_tf=True, strip_accents="unicode"),
+        LogisticRegression(max_iter=1000, class_weight="balanced")
+    )
+
+# Picks the highest event-probability threshold that still keeps at least min_event_recall of events for the LLM
+def choose_reject_threshold(event_probabilities, labels, min_event_recall):
+    event_probabilities = np.sort(event_probabilities[labels == 1])
+    if len(event_probabilities) == 0:
+        return 0.0
+    allowed_misses = int(np.floor(len(event_probabilities) * (1 - min_event_recall)))
+    return float(event_probabilities[allowed_misses])
+
+# Cheap local classifier that skips obvious non-events before they reach the LLM
+class PreClassifier:
+    def __init__(self, model=None, reject_threshold=0.0):
+        self.model = model
+        self.reject_threshold = reject_threshold
+
+    # Trains the model and sets the reject threshold from cross-validated probabilities
+    def fit(self, texts, labels, min_event_recall=0.99):
+        event_probabilities = cross_validated_probabilities(texts, labels)
+        self.reject_threshold = choose_reject_threshold(event_probabilities, labels, min_event_recall)
+        self.model = create_model().fit(texts, labels)
+        return self
+
+    # Scores a batch of posts at once, returning the probability each one is an event
+    def score(self, posts):
+        if not posts:
+            return np.array([])
+        return self.model.predict_proba([prefilter_text(post) for post in posts])[:, 1]
+
+    # Splits a batch into (confident non-events filled in as rejected, uncertain posts that still need the LLM)
+    def split(self, posts):
+        event_probabilities = self.score(posts)
+        rejected_posts = [prefilter_rejected_post(post) for post, probability in zip(posts, event_probabilities) if probability < self.reject_threshold]
+        uncertain_posts = [post for post, probability in zip(posts, event_probabilities) if probability >= self.reject_threshold]
+        return rejected_posts, uncertain_posts
+
+    def save(self, path=prefilter_model_path):
+        with open(path, 'wb') as file:
+            pickle.dump({"model": self.model, "reject_threshold": self.reject_threshold}, file)
+
+    @classmethod
+    def load(cls, path=prefilter_model_path):
+        with open(path, 'rb') as file:
+            saved = pickle.load(file)
+        return cls(saved['model'], saved['reject_threshold'])
+
+# Fills in a post the pre-classifier rejected, in the same shape post_llm returns
+def prefilter_rejected_post(post_dict):
+    post_dict.update({
+        "is_event": "FALSE",
+        "event_type": None,
+        "event_date": None,
+        "event_time": None,
+        "event_location": None,
+        "is_food": None,
+        "food_type": None
+    })
+    print("New Post Pre-filtered as Non-Event: ", post_dict['title'][0])
+    return post_dict
+
+# Out-of-fold event probabilities for every post (each post is scored by a model that never saw it)
+def cross_validated_probabilities(texts, labels, folds=5):
+    texts = np.array(texts, dtype=object)
+    event_probabilities = np.zeros(len(texts))
+    for train_index, test_index in StratifiedKFold(n_splits=folds, shuffle=True, random_state=0).split(texts, labels):
+        model = create_model().fit(list(texts[train_index]), labels[train_index])
+        event_probabilities[test_index] = model.predict_proba(list(texts[test_index]))[:, 1]
+    return event_probabilities
+
+# Reports how well the pre-classifier would have done on the current databases
+def evaluate(store, min_event_recall=0.99):
+    texts, labels = load_training_data(store)
+    event_probabilities = cross_validated_probabilities(texts, labels)
+
+    # Pick the threshold on one half of the out-of-fold scores and measure it on the other half
+    order = np.random.default_rng(0).permutation(len(labels))
+    tune_index, test_index = order[: len(order) // 2], order[len(order) // 2:]
+    reject_threshold = choose_reject_threshold(event_probabilities[tune_index], labels[tune_index], min_event_recall)
+
+    skipped = event_probabilities[test_index] < reject_threshold
+    test_labels = labels[test_index]
+    true_rejects = int(np.sum(skipped & (test_labels == 0)))
+    missed_events = int(np.sum(skipped & (test_labels == 1)))
+    total_rejected = int(np.sum(test_labels == 0))
+
+    print(f"Posts: {len(labels)} ({int(np.sum(labels))} events, {int(np.sum(labels == 0))} rejected), evaluated on {len(test_index)}")
+    print(f"Reject threshold (event probability): {reject_threshold:.3f}")
+    print(f"Skip precision (skipped posts that really were non-events): {true_rejects / max(int(np.sum(skipped)), 1):.3f}")
+    print(f"Skip recall (non-events skipped): {true_rejects / max(total_rejected, 1):.3f}")
+    print(f"Events wrongly skipped: {missed_events} of {int(np.sum(test_labels))}")
+    print(f"LLM calls saved: {int(np.sum(skipped))} of {len(test_index)} ({np.mean(skipped):.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local non-event pre-classifier")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--database", default="events.db")
+    parser.add_argument("--min-event-recall", type=float, default=0.99, help="share of events that must still reach the LLM")
+    args = parser.parse_args()
+
+    # Train from the event store (imports the CSV databases on first use)
+    store = EventStore(args.database)
+    store.migrate_from_csv("events_database.csv", "rejected_database.csv")
+
+    if args.command == "evaluate":
+        evaluate(store, args.min_event_recall)
+    else:
+        texts, labels = load_training_data(store)
+        pre_classifier = PreClassifier().fit(texts, labels, args.min_event_recall)
+        pre_classifier.save()
+        print(f"Pre-classifier saved to {prefilter_model_path} (reject threshold {pre_classifier.reject_threshold:.3f})")
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
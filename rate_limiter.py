@@ -0,0 +1,263 @@
+from collections import deque
+from instrumentation import metrics
+import threading
+import random
+import time
+import re
+
+# Matches each part of a rate-limit reset duration such as "6m0s", "1s" or "20ms"
+duration_part_regex = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+# Converts a reset duration header ("6m0s", "20ms", or plain seconds) to seconds
+def parse_duration(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = duration_part_regex.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+# Header value as a number (None if missing or malformed)
+def header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+# HTTP status of a failed call, read from the exception (OpenAI errors carry status_code, httpx errors a response)
+def error_status(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+# Whether an error means the provider is limiting us (quota exhaustion is not, retrying will not help)
+def is_rate_limit_error(error):
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False
+    if error_status(error) == 429:
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "too many requests" in message or "queue is full" in message
+
+# Whether an error is worth retrying (rate limits, server errors, timeouts and dropped connections)
+def is_retryable_error(error):
+    if is_rate_limit_error(error):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status >= 500 or status == 408
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+# Refills continuously up to a per-minute limit, callers wait until enough is available
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.available = per_minute
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Adds what has refilled since the last update (caller holds the lock)
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.per_minute, self.available + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+
+    # Waits until amount is available and takes it (amounts above the limit only wait for a full bucket)
+    def acquire(self, amount=1):
+        amount = min(amount, self.per_minute)
+        while True:
+            with self.lock:
+                self.refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) * 60 / self.per_minute
+            time.sleep(wait)
+
+    # Corrects the bucket once the real amount is known (e.g. tokens used instead of the estimate)
+    def adjust(self, amount):
+        with self.lock:
+            self.refill()
+            self.available = min(self.per_minute, self.available - amount)
+
+    # Follows the provider's view of the limit (x-ratelimit-limit/remaining headers)
+    def update(self, limit=None, remaining=None):
+        with self.lock:
+            self.refill()
+            if limit:
+                self.per_minute = limit
+            if remaining is not None:
+                self.available = min(self.available, remaining)
+
+# Additive-increase/multiplicative-decrease limit on calls in flight
+class ConcurrencyController:
+    def __init__(self, initial=4, minimum=1, maximum=32):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    # Grows by about one slot per window of successful calls
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    # Halves the limit, at most once per cooldown so a burst of 429s from one window only counts once
+    def on_rate_limited(self, cooldown=1.0):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease >= cooldown:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+
+# Shared scheduler for one LLM backend: request and token buckets, adaptive concurrency and retries with backoff
+class RequestScheduler:
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, initial_concurrency=4, max_concurrency=32,
+                 max_retries=6, backoff_base=1.0, backoff_max=60.0):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = ConcurrencyController(initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base  # Seconds before the first retry
+        self.backoff_max = backoff_max  # Longest wait between retries
+        self.paused_until = 0.0  # Every caller waits after a rate limit, not only the one that hit it
+        self.lock = threading.Lock()
+        self.completed = deque()  # Finish times of recent calls, for live throughput
+        self.token_log = deque()  # (time, tokens) of recent calls, corrected once the real usage is known
+        self.counts = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    # Waits out a pause set by a rate limit
+    def wait_if_paused(self):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    # Pauses every caller for delay seconds
+    def pause(self, delay):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    # Jittered exponential backoff, or the provider's retry-after when it sends one
+    def backoff_delay(self, attempt, error):
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        retry_after = parse_duration(headers.get("retry-after"))
+        if headers.get("retry-after-ms"):
+            retry_after = parse_duration(headers.get("retry-after-ms")) / 1000
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 0.5)
+        return min(self.backoff_base * 2 ** attempt, self.backoff_max) * random.uniform(0.5, 1.5)
+
+    # Updates the buckets from x-ratelimit-* response headers (OpenAI sends them on every response)
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+        if self.request_bucket is not None:
+            self.request_bucket.update(header_number(headers, "x-ratelimit-limit-requests"), header_number(headers, "x-ratelimit-remaining-requests"))
+        if self.token_bucket is not None:
+            self.token_bucket.update(header_number(headers, "x-ratelimit-limit-tokens"), header_number(headers, "x-ratelimit-remaining-tokens"))
+
+        # Out of requests or tokens for this window: hold everyone until it resets
+        for kind in ("requests", "tokens"):
+            if header_number(headers, f"x-ratelimit-remaining-{kind}") == 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause(reset)
+
+    # Records the real token usage of a call (the estimate was taken from the bucket before it)
+    def record_tokens(self, estimated_tokens, used_tokens):
+        if used_tokens is None:
+            return
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(used_tokens - estimated_tokens)
+        with self.lock:
+            self.token_log.append((time.monotonic(), used_tokens - estimated_tokens))
+
+    # Runs request() within the limits, retrying rate limits and transient errors with backoff
+    # request() may return (result, headers) by setting returns_headers, so the buckets follow the provider's counters
+    def call(self, request, estimated_tokens=0, returns_headers=False):
+        for attempt in range(self.max_retries + 1):
+            self.wait_if_paused()
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None and estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+
+            self.concurrency.acquire()
+            try:
+                with metrics.timer(f"{self.name}.request"):
+                    result = request()
+            except Exception as e:
+                self.concurrency.release()
+                if not is_retryable_error(e) or attempt == self.max_retries:
+                    with self.lock:
+                        self.counts['failed'] += 1
+                    metrics.count(f"{self.name}.failed")
+                    raise
+
+                delay = self.backoff_delay(attempt, e)
+                with self.lock:
+                    self.counts['retries'] += 1
+                metrics.count(f"{self.name}.retries")
+                if is_rate_limit_error(e):
+                    with self.lock:
+                        self.counts['rate_limited'] += 1
+                    metrics.count(f"{self.name}.rate_limited")
+                    self.concurrency.on_rate_limited(cooldown=delay)
+                    self.pause(delay)
+                print(f"{self.name} request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.concurrency.release()
+            self.concurrency.on_success()
+            if returns_headers:
+                result, headers = result
+                self.update_from_headers(headers)
+            with self.lock:
+                self.counts['calls'] += 1
+                self.completed.append(time.monotonic())
+                self.token_log.append((time.monotonic(), estimated_tokens))
+            return result
+
+    # Live view: calls and tokens over the last minute, concurrency limit and retry counts
+    def stats(self):
+        with self.lock:
+            cutoff = time.monotonic() - 60
+            while self.completed and self.completed[0] < cutoff:
+                self.completed.popleft()
+            while self.token_log and self.token_log[0][0] < cutoff:
+                self.token_log.popleft()
+            stats = dict(self.counts)
+            stats['requests_last_minute'] = len(self.completed)
+            stats['tokens_last_minute'] = int(sum(tokens for _, tokens in self.token_log))
+        stats['concurrency_limit'] = int(self.concurrency.limit)
+        stats['in_flight'] = self.concurrency.in_flight
+        return stats
@@ -0,0 +1,74 @@
+import json
+import time
+import os
+
+# cryptography is optional, without it sessions are not saved and every run logs in
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+# Encrypted file holding an authenticated EdStem session (cookies and local storage, which has the API token)
+class SessionStore:
+    def __init__(self, path="edstem_session.bin", key_path="edstem_session.key", max_age_days=30):
+        self.path = path
+        self.key_path = key_path  # Used when EDSTEM_SESSION_KEY is not set
+        self.max_age = max_age_days * 24 * 60 * 60  # Older sessions are not even tried
+        self.fernet = Fernet(self.load_key()) if Fernet is not None else None
+        if self.fernet is None:
+            print("cryptography is not installed, the EdStem session will not be saved")
+
+    # Reads the encryption key from EDSTEM_SESSION_KEY or the key file, creating the file on first use
+    def load_key(self):
+        key = os.environ.get("EDSTEM_SESSION_KEY")
+        if key:
+            return key.encode()
+
+        try:
+            with open(self.key_path, 'rb') as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            key = Fernet.generate_key()
+            write_private_file(self.key_path, key)
+            return key
+
+    # Encrypts and saves a session ({"cookies": [...], "local_storage": {...}})
+    def save(self, session_data):
+        if self.fernet is None:
+            return False
+        session_data = dict(session_data, saved_at=time.time())
+        write_private_file(self.path, self.fernet.encrypt(json.dumps(session_data).encode()))
+        print("EdStem session saved!")
+        return True
+
+    # Loads the saved session, or None if there is none, it is too old or it cannot be decrypted
+    def load(self):
+        if self.fernet is None:
+            return None
+        try:
+            with open(self.path, 'rb') as file:
+                session_data = json.loads(self.fernet.decrypt(file.read()))
+        except FileNotFoundError:
+            return None
+        except (InvalidToken, ValueError):
+            print("Saved EdStem session could not be read, logging in again")
+            return None
+
+        if time.time() - session_data.get('saved_at', 0) > self.max_age:
+            return None
+        return session_data
+
+    # Deletes the saved session (e.g. after it was rejected)
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Writes a file only the current user can read, replacing it atomically
+def write_private_file(path, content):
+    temporary_path = path + ".tmp"
+    file_descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, 'wb') as file:
+        file.write(content)
+    os.replace(temporary_path, path)
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Make the repository modules importable when run as python -m pytest from the repository or tests folder
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from event_store import EventStore
+
+# Empty event store in a temporary folder
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
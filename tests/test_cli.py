@@ -0,0 +1,24 @@
+import cli
+from event_store import EventStore
+from llm_cache import LLMCache
+
+def run_stats(tmp_path, capsys):
+    args = cli.build_parser().parse_args(["stats", "--database", str(tmp_path / "events.db"), "--cache", str(tmp_path / "llm_cache.db")])
+    args.handler(args)
+    return capsys.readouterr().out
+
+def test_stats_without_databases_creates_nothing(tmp_path, capsys):
+    assert "No event database" in run_stats(tmp_path, capsys)
+    assert list(tmp_path.iterdir()) == []
+
+def test_stats_reads_without_creating_the_cache(tmp_path, capsys):
+    EventStore(str(tmp_path / "events.db")).close()
+    output = run_stats(tmp_path, capsys)
+    assert "Events: 0" in output and "LLM Cache Entries: 0" in output
+    assert "Work Queue" not in output
+    assert not (tmp_path / "llm_cache.db").exists()
+
+    cache = LLMCache(str(tmp_path / "llm_cache.db"))
+    cache.set("key", {"is_event": "TRUE"})
+    cache.close()
+    assert "LLM Cache Entries: 1" in run_stats(tmp_path, capsys)
@@ -0,0 +1,90 @@
+import threading
+from queue import Queue
+
+import pipeline
+from duplicate_index import DuplicateIndex
+from work_queue import WorkQueue
+
+description = "Join us for the fall career fair in Pauley Ballroom with over forty companies hiring interns and new graduates, free pizza for everyone who stops by"
+
+def link(thread_id, course_id=1):
+    return f"https://edstem.org/us/courses/{course_id}/discussion/{thread_id}"
+
+# post_dict as the scrapers return it
+def post_dict(thread_id, course_id=1, title="Career Fair #12", text=description, date_posted="2024-10-01T12:00:00.000000Z"):
+    return {"post_link": [link(thread_id, course_id)], "title": [title], "date_posted": [date_posted], "posted_by": ["Staff"],
+            "description": [text], "image_url": [None]}
+
+# The same post after the LLM classified it
+def post_llm_dict(thread_id, course_id=1, **kwargs):
+    return dict(post_dict(thread_id, course_id, **kwargs), is_event="TRUE", event_type="Fair", event_date="14-Oct-2024", event_time="10:00 AM",
+                event_location="Pauley Ballroom", is_food="TRUE", food_type="Pizza")
+
+def test_find_and_split_after_add(store):
+    index = DuplicateIndex(store)
+    assert index.find(post_dict(2, course_id=2)) is None
+
+    assert index.add(post_llm_dict(1))
+    assert not index.add(post_llm_dict(1))  # Already indexed
+    assert index.find(post_dict(2, course_id=2, title="Career Fair #7")) == link(1)
+    assert index.find(post_dict(3, text="Office hours this week move to Soda 380 on Thursday")) is None
+    assert index.find(post_dict(4, date_posted="2024-12-01T12:00:00.000000Z")) is None  # Reposted for a later event
+
+    duplicate_posts, unique_posts = index.split([post_dict(2, course_id=2), post_dict(3, text="Office hours move to Soda 380")])
+    assert [post['post_link'][0] for post in unique_posts] == [link(3)]
+    assert duplicate_posts[0]['canonical_link'] == link(1)
+    assert duplicate_posts[0]['event_location'] == "Pauley Ballroom"
+
+    # Linked copies are never indexed themselves
+    assert not index.add(duplicate_posts[0])
+
+def test_signatures_are_saved_for_the_next_run(store):
+    store.add_posts([post_llm_dict(1)])
+    DuplicateIndex(store).add(post_llm_dict(1))
+    assert store.connection.execute("SELECT COUNT(*) FROM post_signatures").fetchone()[0] == 1
+
+    index = DuplicateIndex(store)
+    assert index.find(post_dict(2, course_id=2)) == link(1)
+    assert index.classifications[link(1)]['event_location'] == "Pauley Ballroom"
+
+def test_group_near_duplicates_within_a_batch(store):
+    index = DuplicateIndex(store)
+    batch = [post_dict(1), post_dict(2, text="Office hours move to Soda 380"), post_dict(3, course_id=2, title="Career Fair #40"), post_dict(4, course_id=3)]
+    representatives, copies = index.group(batch)
+    assert [post['post_link'][0] for post in representatives] == [link(1), link(2)]
+    assert [(copy['post_link'][0], representative['post_link'][0]) for copy, representative in copies] == [(link(3, 2), link(1)), (link(4, 3), link(1))]
+
+    copy = index.copy_classification(copies[0][0], link(1), post_llm_dict(1))
+    assert copy['canonical_link'] == link(1) and copy['event_type'] == "Fair"
+
+def test_pipeline_sends_one_post_per_group_and_indexes_only_stored_posts(store, monkeypatch):
+    sent = []
+    def fake_post_llm_batch(openai_api_key, post_dict_list, cache=None):
+        sent.extend(post['post_link'][0] for post in post_dict_list)
+        return [post_llm_dict(1)]
+    monkeypatch.setattr(pipeline, "post_llm_batch", fake_post_llm_batch)
+
+    index = DuplicateIndex(store)
+    results, failures = pipeline.classify_batch("key", [post_dict(1), post_dict(2, course_id=2)], None, None, index)
+    assert sent == [link(1)] and failures == []
+    assert [post.get('canonical_link') for post in results] == [None, link(1)]
+    assert index.find(post_dict(3, course_id=3)) is None  # Not stored yet
+
+    # A batch that cannot be stored is not indexed
+    work_queue = WorkQueue(store)
+    work_queue.enqueue([link(1), link(2, 2)])
+    work_queue.claim(2)
+    def failing_complete(post_llm_dict_list):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(work_queue, "complete", failing_complete)
+    result_queue = Queue()
+    for post in results + [pipeline.STAGE_DONE]:
+        result_queue.put(post)
+    pipeline.database_writer(result_queue, work_queue, 10, 0.05, index, threading.Event())
+    assert index.find(post_dict(3, course_id=3)) is None
+
+    monkeypatch.undo()
+    for post in results + [pipeline.STAGE_DONE]:
+        result_queue.put(post)
+    pipeline.database_writer(result_queue, work_queue, 10, 0.05, index, threading.Event())
+    assert store.contains(link(1)) and index.find(post_dict(3, course_id=3)) == link(1)
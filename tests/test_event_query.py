@@ -0,0 +1,57 @@
+from datetime import datetime, date
+
+from event_query import EventIndex
+
+now = datetime(2024, 10, 14, 9, 0)
+
+def link(thread_id):
+    return f"https://edstem.org/us/courses/1/discussion/{thread_id}"
+
+# post_llm_dict as the pipeline stores it
+def post_llm_dict(thread_id, event_type="Social", event_date="14-Oct-2024", event_time="12:00 PM", is_food="TRUE", food_type="Pizza", is_event="TRUE"):
+    return {
+        "post_link": [link(thread_id)], "title": [f"Post {thread_id}"], "date_posted": ["2024-10-01T12:00:00.000000Z"], "posted_by": ["Staff"],
+        "description": ["Description"], "image_url": [None], "is_event": is_event, "event_type": event_type, "event_date": event_date,
+        "event_time": event_time, "event_location": "Soda Hall", "is_food": is_food, "food_type": food_type
+    }
+
+def titles(events):
+    return [event.title for event in events]
+
+def test_refresh_indexes_only_new_events(tmp_path, store):
+    store.add_posts([post_llm_dict(1), post_llm_dict(2, is_event="FALSE")])
+    index = EventIndex(store, threads_csv_path=str(tmp_path / "missing.csv"))
+    assert titles(index.events) == ["Post 1"]
+    assert index.refresh() == 0
+
+    store.add_posts([post_llm_dict(3), dict(post_llm_dict(4), canonical_link=link(3))])
+    assert index.refresh() == 1  # The near-duplicate is listed through post 3
+    assert titles(index.events) == ["Post 1", "Post 3"]
+    assert index.events[0].department == "Unknown"
+
+def test_queries(tmp_path, store):
+    store.add_posts([
+        post_llm_dict(1, event_time="06:00 PM"),
+        post_llm_dict(2, event_type="Workshop", event_time="10:00 AM", is_food="LIKELY", food_type="Snacks"),
+        post_llm_dict(3, event_type="Fair", event_date="16-Oct-2024", food_type="pizza"),
+        post_llm_dict(4, event_time=None, is_food="FALSE", food_type="None"),
+        post_llm_dict(5, event_time="08:00 AM")
+    ])
+    index = EventIndex(store, threads_csv_path=str(tmp_path / "missing.csv"))
+
+    assert titles(index.between(datetime(2024, 10, 14, 9, 0), datetime(2024, 10, 14, 23, 0))) == ["Post 2", "Post 1"]
+    assert titles(index.on_date(date(2024, 10, 14))) == ["Post 4", "Post 5", "Post 2", "Post 1"]
+    assert titles(index.of_type("Workshop")) == ["Post 2"]
+    assert index.of_type("Lecture") == []
+
+    # Events with only a date count as upcoming for the whole day, started ones do not
+    assert titles(index.upcoming(12, now)) == ["Post 4", "Post 2", "Post 1"]
+    assert titles(index.food_events(12, now)) == ["Post 1"]
+    assert titles(index.food_events(12, now, include_likely=True)) == ["Post 2", "Post 1"]
+    assert titles(index.food_events(72, now)) == ["Post 1", "Post 3"]
+
+    assert titles(index.with_food()) == ["Post 1", "Post 3", "Post 5"]
+    assert titles(index.with_food("PIZZA")) == ["Post 1", "Post 3", "Post 5"]
+    assert titles(index.with_food("snacks")) == []
+    assert titles(index.with_food("snacks", include_likely=True)) == ["Post 2"]
+    assert index.events[3].food_type is None
@@ -0,0 +1,46 @@
+from event_store import EventStore, post_columns
+
+header = ",".join(post_columns)
+
+# A CSV row as the original scraper wrote it (every cell a stringified one-element list, LLM fields quoted by the regex parser)
+def csv_row(thread_id, title, is_event):
+    return (f"\"['https://edstem.org/us/courses/1/discussion/{thread_id}\\n']\",['{title}'],['11-Sep-2024 23:03:08.865000Z'],['Staff'],"
+            f"\"['Free pizza']\",[None],{is_event},\"Social,\",\"14-Oct-2024\",12:00 PM,Durant Hall,TRUE,Pizza\n")
+
+def test_migrate_from_csv(tmp_path, store):
+    events_path = tmp_path / "events_database.csv"
+    rejected_path = tmp_path / "rejected_database.csv"
+    # The first appended row can end up on the header line
+    events_path.write_text(header + csv_row(1, "Pizza talk", "TRUE") + csv_row(2, "Career fair", "TRUE"), encoding="utf-8")
+    rejected_path.write_text(header + "\n" + csv_row(3, "Office hours", "TRUE") + csv_row(1, "Pizza talk", "TRUE"), encoding="utf-8")
+
+    assert store.migrate_from_csv(str(events_path), str(rejected_path)) == 3
+    assert store.count(is_event=True) == 2
+    assert store.count(is_event=False) == 1  # The rejected database decides is_event, and the copy of post 1 is skipped
+
+    row = store.connection.execute("SELECT * FROM posts WHERE post_link = ?", ("https://edstem.org/us/courses/1/discussion/1",)).fetchone()
+    assert row['title'] == "Pizza talk"
+    assert row['date_posted'] == "2024-09-11T23:03:08.865000Z"
+    assert row['event_type'] == "Social"
+    assert row['food_type'] == "Pizza"
+
+    # Later runs do not import again
+    assert store.migrate_from_csv(str(events_path), str(rejected_path)) == 0
+
+def test_migrate_without_csv_files(tmp_path, store):
+    assert store.migrate_from_csv(str(tmp_path / "missing.csv"), str(tmp_path / "missing_too.csv")) == 0
+    assert store.count() == 0
+
+def test_migration_is_recorded_in_the_database(tmp_path):
+    path = str(tmp_path / "events.db")
+    events_path = tmp_path / "events_database.csv"
+    events_path.write_text(header + "\n" + csv_row(1, "Pizza talk", "TRUE"), encoding="utf-8")
+
+    store = EventStore(path)
+    store.migrate_from_csv(str(events_path), str(tmp_path / "missing.csv"))
+    store.close()
+
+    store = EventStore(path)
+    assert store.migrate_from_csv(str(events_path), str(tmp_path / "missing.csv")) == 0
+    assert store.contains("https://edstem.org/us/courses/1/discussion/1")
+    store.close()
@@ -0,0 +1,74 @@
+import pytest
+
+from link_index import LinkIndex, parse_edstem_link, normalize_edstem_link
+from work_queue import WorkQueue
+from functions import new_thread_post_links
+
+def link(thread_id, course_id=1):
+    return f"https://edstem.org/us/courses/{course_id}/discussion/{thread_id}"
+
+# post_llm_dict as the pipeline hands it to the work queue
+def post_llm_dict(post_link):
+    return {
+        "post_link": [post_link], "title": ["Title"], "date_posted": ["2024-03-01T12:00:00.000000Z"], "posted_by": ["Someone"],
+        "description": ["Description"], "image_url": [None], "is_event": "FALSE", "event_type": None, "event_date": None,
+        "event_time": None, "event_location": None, "is_food": "FALSE", "food_type": None
+    }
+
+def test_normalize_edstem_link_variants():
+    assert normalize_edstem_link("https://edstem.org/courses/12/discussion/345?comment=6\n") == link(345, 12)
+    assert parse_edstem_link(link(345, 12)) == (12, 345)
+    with pytest.raises(ValueError):
+        parse_edstem_link("https://example.com/discussion/1")
+
+def test_link_index_add_and_contains():
+    link_index = LinkIndex()
+    assert link_index.add(link(30))
+    assert link_index.add(link(10))
+    assert not link_index.add(link(30))
+    assert link_index.contains(link(10))
+    assert not link_index.contains(link(20))
+    assert not link_index.contains(link(10, course_id=2))
+    assert len(link_index) == 2
+
+def test_link_index_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "link_index.bin")
+    link_index = LinkIndex(path)
+    for thread_id, course_id in [(5, 1), (3, 1), (7, 2), (2 ** 40, 3)]:
+        link_index.add(link(thread_id, course_id))
+    link_index.save()
+
+    loaded = LinkIndex(path)
+    assert loaded.load()
+    assert loaded.courses == link_index.courses
+    assert loaded.contains(link(2 ** 40, 3))
+    assert not LinkIndex(str(tmp_path / "missing.bin")).load()
+
+def test_link_index_built_from_store_and_queue(store, tmp_path):
+    work_queue = WorkQueue(store)
+    work_queue.enqueue([link(1)])
+    work_queue.complete([post_llm_dict(link(1))])
+    work_queue.enqueue([link(2)])
+
+    link_index = LinkIndex.load_or_build(str(tmp_path / "link_index.bin"), store)
+    assert link_index.contains(link(1)) and link_index.contains(link(2))
+    assert LinkIndex.load_or_build(str(tmp_path / "link_index.bin"), store).courses == link_index.courses
+
+def test_enqueue_drops_links_known_to_the_link_index(store):
+    link_index = LinkIndex()
+    link_index.add(link(1))
+    work_queue = WorkQueue(store, link_index=link_index)
+    assert work_queue.enqueue([link(1), link(2)]) == 1
+    assert link_index.contains(link(2))
+
+def test_thread_links_skip_known_posts_but_still_move_the_high_water_mark():
+    link_index = LinkIndex()
+    link_index.add(link(120))
+    link_index.add(link(130))
+
+    new_post_links, high_water_mark = new_thread_post_links([link(130), link(125), link(120)], 100, link_index)
+    assert new_post_links == [link(125)]
+    assert high_water_mark == 130
+
+    # A thread with only known posts still gets a mark, so the next run stops early
+    assert new_thread_post_links([link(130), link(120)], 0, link_index) == ([], 130)
@@ -0,0 +1,22 @@
+import pytest
+
+from functions import validate_post_llm_answer, parse_json_reply
+
+def test_parse_json_reply():
+    assert parse_json_reply('Here you go:\n```json\n{"posts": []}\n```') == {"posts": []}
+    with pytest.raises(ValueError):
+        parse_json_reply("no JSON here")
+    with pytest.raises(ValueError):
+        parse_json_reply('{"posts": [}')
+
+def test_validate_post_llm_answer():
+    answer = {"is_event": "true", "event_type": "Social", "event_date": "1-Mar-2024", "event_time": "6:30 pm",
+              "event_location": " Soda Hall ", "is_food": "likely", "food_type": None}
+    assert validate_post_llm_answer(answer) == {"is_event": "TRUE", "event_type": "Social", "event_date": "01-Mar-2024", "event_time": "6:30 PM",
+                                                "event_location": "Soda Hall", "is_food": "LIKELY", "food_type": None}
+
+    for key, value in [("is_event", "maybe"), ("event_type", "Party"), ("event_date", "2024-03-01"), ("event_time", "18:30"), ("is_food", "YES")]:
+        with pytest.raises(ValueError):
+            validate_post_llm_answer(dict(answer, **{key: value}))
+    with pytest.raises(ValueError):
+        validate_post_llm_answer({"is_event": True})
@@ -0,0 +1,49 @@
+import time
+
+from llm_cache import LLMCache, llm_cache_key
+
+def test_cache_key_ignores_whitespace_but_not_model_or_prompt():
+    key = llm_cache_key({"title": "Free  pizza\n", "description": "Soda Hall"}, "gpt-4o-mini", 1)
+    assert key == llm_cache_key({"title": "Free pizza", "description": " Soda  Hall"}, "gpt-4o-mini", 1)
+    assert key != llm_cache_key({"title": "Free pizza", "description": "Soda Hall"}, "gpt-4o", 1)
+    assert key != llm_cache_key({"title": "Free pizza", "description": "Soda Hall"}, "gpt-4o-mini", 2)
+
+def test_hit_and_miss(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"))
+    assert cache.get("key") is None
+    cache.set("key", {"is_event": "TRUE"})
+    assert cache.get("key") == {"is_event": "TRUE"}
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+    cache.close()
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+    cache = LLMCache(path)
+    cache.set("key", {"is_event": "FALSE"})
+    cache.close()
+
+    cache = LLMCache(path)
+    assert cache.get("key") == {"is_event": "FALSE"}
+    cache.close()
+
+def test_expired_entries_are_misses_and_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"), max_age_days=1)
+    cache.set("key", {"is_event": "TRUE"})
+    cache.connection.execute("UPDATE llm_cache SET created_at = ?", (time.time() - 2 * 24 * 60 * 60,))
+    assert cache.get("key") is None
+
+    cache.evict()
+    assert cache.stats()['entries'] == 0
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted_beyond_max_entries(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.db"), max_entries=2)
+    for index, key in enumerate(["old", "used", "new"]):
+        cache.set(key, {"index": index})
+        cache.connection.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (1000 + index, key))
+    cache.connection.execute("UPDATE llm_cache SET last_used_at = 2000 WHERE key = 'used'")
+
+    cache.evict()
+    assert cache.get("old") is None
+    assert cache.get("used") == {"index": 1} and cache.get("new") == {"index": 2}
+    cache.close()
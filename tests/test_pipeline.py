@@ -0,0 +1,111 @@
+import threading
+from queue import Queue
+
+import pytest
+
+# pipeline imports functions, which needs requests for the EdStem API
+pytest.importorskip("requests")
+
+import pipeline
+from work_queue import WorkQueue
+
+def link(thread_id):
+    return f"https://edstem.org/us/courses/1/discussion/{thread_id}"
+
+# post_dict as post_fetcher returns it
+def fake_post_fetcher(session, post_link):
+    return {"post_link": [post_link], "title": ["Title"], "date_posted": ["2024-03-01T12:00:00.000000Z"], "posted_by": ["Someone"],
+            "description": ["Description"], "image_url": [None]}
+
+# post_llm_batch answering every post as a non-event
+def fake_post_llm_batch(openai_api_key, post_dict_list, cache=None):
+    return [dict(post_dict, is_event="FALSE", event_type=None, event_date=None, event_time=None, event_location=None, is_food="FALSE", food_type=None)
+            for post_dict in post_dict_list]
+
+class RaisingPrefilter:
+    def split(self, post_dict_list):
+        raise RuntimeError("prefilter failed")
+
+@pytest.fixture
+def work_queue(store, monkeypatch):
+    monkeypatch.setattr(pipeline, "post_fetcher", fake_post_fetcher)
+    monkeypatch.setattr(pipeline, "post_llm_batch", fake_post_llm_batch)
+    work_queue = WorkQueue(store)
+    work_queue.enqueue([link(thread_id) for thread_id in range(1, 41)])
+    return work_queue
+
+# Runs the pipeline in a thread so a hang fails the test instead of blocking it
+def run_pipeline_with_timeout(work_queue, timeout=30, **kwargs):
+    thread = threading.Thread(target=pipeline.run_pipeline, args=([], "key", work_queue),
+                              kwargs=dict(dict(session=object(), scrape_workers=4, llm_workers=2, llm_batch_wait=0.05, queue_size=4), **kwargs))
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "run_pipeline did not return"
+
+def test_put_item_gives_up_on_a_full_queue_once_stopped():
+    queue = Queue(maxsize=1)
+    stopped = threading.Event()
+    assert pipeline.put_item(queue, 1, stopped)
+    stopped.set()
+    assert not pipeline.put_item(queue, 2, stopped)
+
+def test_get_item_ends_the_stage_on_an_empty_queue_once_stopped():
+    queue = Queue()
+    stopped = threading.Event()
+    queue.put(1)
+    stopped.set()
+    assert pipeline.get_item(queue, stopped) == 1
+    assert pipeline.get_item(queue, stopped) is pipeline.STAGE_DONE
+
+def test_run_stage_stops_the_pipeline_when_a_worker_crashes():
+    stopped = threading.Event()
+    def crash():
+        raise RuntimeError("worker crashed")
+    pipeline.run_stage("Test", crash, (), stopped)
+    assert stopped.is_set()
+
+def test_pipeline_processes_every_link(work_queue):
+    run_pipeline_with_timeout(work_queue)
+    assert work_queue.counts() == {"pending": 0, "in_flight": 0, "done": 40, "failed": 0}
+
+def test_failing_batches_are_retried_later(work_queue):
+    run_pipeline_with_timeout(work_queue, prefilter=RaisingPrefilter())
+    assert work_queue.counts() == {"pending": 40, "in_flight": 0, "done": 0, "failed": 0}
+
+def test_failing_writes_are_retried_later(work_queue, monkeypatch):
+    complete = work_queue.complete
+    calls = []
+    def complete_once_failing(post_llm_dict_list):
+        calls.append(len(post_llm_dict_list))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return complete(post_llm_dict_list)
+    monkeypatch.setattr(work_queue, "complete", complete_once_failing)
+
+    run_pipeline_with_timeout(work_queue)
+    counts = work_queue.counts()
+    assert counts['pending'] == calls[0] and counts['done'] == 40 - calls[0] and counts['in_flight'] == 0
+
+def test_crashed_stage_stops_the_pipeline_instead_of_hanging(work_queue, monkeypatch):
+    # Recording the failure also fails, so the LLM workers die
+    def fail_posts(work_queue, post_dict_list, error):
+        raise RuntimeError("database is gone")
+    monkeypatch.setattr(pipeline, "fail_posts", fail_posts)
+
+    run_pipeline_with_timeout(work_queue, prefilter=RaisingPrefilter())
+    counts = work_queue.counts()
+    assert counts['done'] == 0 and counts['in_flight'] > 0
+    assert work_queue.recover() == counts['in_flight']
+
+def test_api_errors_are_raised_without_a_driver_pool(work_queue, monkeypatch):
+    def failing_post_fetcher(session, post_link):
+        raise ConnectionError("API down")
+    monkeypatch.setattr(pipeline, "post_fetcher", failing_post_fetcher)
+
+    with pytest.raises(ConnectionError):
+        pipeline.scrape_post(object(), None, link(1))
+    with pytest.raises(ValueError):
+        pipeline.run_pipeline([], "key", work_queue)
+
+    run_pipeline_with_timeout(work_queue)
+    assert work_queue.counts()['done'] == 0 and work_queue.counts()['in_flight'] == 0
@@ -0,0 +1,87 @@
+import pytest
+
+from rate_limiter import RequestScheduler, ConcurrencyController, parse_duration, is_rate_limit_error, is_retryable_error
+
+# Error shaped like an OpenAI API error
+class APIError(Exception):
+    def __init__(self, status_code, code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.code = code
+
+def test_parse_duration():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1.5s") == 1.5
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("2") == 2
+    assert parse_duration("soon") is None and parse_duration(None) is None
+
+def test_retry_rules():
+    assert is_rate_limit_error(APIError(429))
+    assert not is_rate_limit_error(APIError(429, code="insufficient_quota"))
+    assert is_retryable_error(APIError(503))
+    assert is_retryable_error(TimeoutError())
+    assert not is_retryable_error(APIError(400))
+    assert not is_retryable_error(ValueError("bad answer"))
+
+def test_scheduler_retries_transient_errors():
+    scheduler = RequestScheduler("test", backoff_base=0.001, backoff_max=0.01)
+    errors = [APIError(429), APIError(500)]
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert scheduler.call(request) == "ok"
+    stats = scheduler.stats()
+    assert stats['calls'] == 1 and stats['retries'] == 2 and stats['rate_limited'] == 1
+
+def test_scheduler_does_not_retry_permanent_errors():
+    scheduler = RequestScheduler("test", max_retries=3, backoff_base=0.001)
+    attempts = []
+    def request():
+        attempts.append(1)
+        raise APIError(429, code="insufficient_quota")
+
+    with pytest.raises(APIError):
+        scheduler.call(request)
+    assert len(attempts) == 1 and scheduler.stats()['failed'] == 1
+
+def test_scheduler_gives_up_after_max_retries():
+    scheduler = RequestScheduler("test", max_retries=2, backoff_base=0.001, backoff_max=0.001)
+    def request():
+        raise APIError(503)
+
+    with pytest.raises(APIError):
+        scheduler.call(request)
+    assert scheduler.stats()['retries'] == 2
+
+def test_concurrency_controller_aimd():
+    controller = ConcurrencyController(initial=8, minimum=1, maximum=10)
+    controller.on_rate_limited(cooldown=0)
+    assert controller.limit == 4
+    controller.on_rate_limited(cooldown=60)  # Within the cooldown of the last decrease
+    assert controller.limit == 4
+    for _ in range(100):
+        controller.on_success()
+    assert controller.limit == 10
+
+def test_only_vision_answers_count_against_the_hugging_face_quota(monkeypatch):
+    import json
+    import functions
+
+    answer = {"is_event": "TRUE", "event_type": "Social", "event_date": "14-Oct-2024", "event_time": "12:00 PM",
+              "event_location": "Soda Hall", "is_food": "TRUE", "food_type": "Pizza"}
+    calls = []
+    class FakeClient:
+        def predict(self, *args, api_name=None, **kwargs):
+            calls.append(api_name)
+            return [] if api_name == "/upload_img" else [[None, json.dumps(answer)]]
+    scheduler = RequestScheduler("test")
+    monkeypatch.setattr(functions, "hf_scheduler", scheduler)
+    monkeypatch.setattr(functions, "get_gradio_client", lambda hf_token: FakeClient())
+    monkeypatch.setattr(functions, "gradio_file", lambda image_path: image_path)
+
+    assert functions.post_image_llm("token", "Pizza social", "https://example.com/poster.png")['event_location'] == "Soda Hall"
+    assert calls == ["/upload_img", "/respond"]
+    assert scheduler.stats()['calls'] == 1
@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+from functions import reached_scraped_posts, parse_utc_time, new_thread_post_links, thread_page_size
+
+def link(thread_id):
+    return f"https://edstem.org/us/courses/1/discussion/{thread_id}"
+
+last_scraped = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+def test_parse_utc_time():
+    assert parse_utc_time("01-Mar-2024 12:00:00") == last_scraped
+    assert parse_utc_time("2024-03-01T12:00:00.000Z") == last_scraped
+    assert parse_utc_time("2024-03-01T04:00:00-08:00") == last_scraped
+    assert parse_utc_time("2024-03-01T12:00:00") == last_scraped
+    assert parse_utc_time("yesterday") is None and parse_utc_time(None) is None
+
+def test_stops_once_the_last_row_is_older_than_the_last_run():
+    rows = [[link(120), "2024-03-02T00:00:00Z"], [link(99), "2024-03-01T11:59:00Z"]]
+    assert reached_scraped_posts(rows, 100, last_scraped)
+
+def test_keeps_scrolling_past_an_old_post_with_new_activity():
+    # Post 5 got a reply after the last run, so newer posts can still be below it
+    rows = [[link(120), "2024-03-02T00:00:00Z"], [link(5), "2024-03-01T13:00:00Z"]]
+    assert not reached_scraped_posts(rows, 100, last_scraped)
+
+def test_without_activity_times_a_whole_page_of_known_posts_is_needed():
+    assert not reached_scraped_posts([[link(5), None]], 100, last_scraped)
+    assert not reached_scraped_posts([[link(thread_id), None] for thread_id in range(thread_page_size - 1)] + [[link(200), None]], 100, None)
+    assert reached_scraped_posts([[link(thread_id), None] for thread_id in range(thread_page_size)], 100, None)
+    assert not reached_scraped_posts([], 100, last_scraped)
+
+def test_only_posts_above_the_high_water_mark_are_new():
+    loaded_links = [link(130), "https://edstem.org/courses/1/discussion/130?comment=2", link(90), link(110)]
+    new_post_links, high_water_mark = new_thread_post_links(loaded_links, 100)
+    assert new_post_links == [link(130), link(110)]
+    assert high_water_mark == 130
+
+def test_high_water_mark_never_moves_back():
+    assert new_thread_post_links([link(50)], 100) == ([], 100)
+    assert new_thread_post_links([], 100) == ([], 100)
@@ -0,0 +1,54 @@
+import time
+
+from work_queue import WorkQueue
+
+def link(thread_id, course_id=1):
+    return f"https://edstem.org/us/courses/{course_id}/discussion/{thread_id}"
+
+# post_llm_dict as the pipeline hands it to the work queue
+def post_llm_dict(post_link, is_event="FALSE"):
+    return {
+        "post_link": [post_link], "title": ["Title"], "date_posted": ["2024-03-01T12:00:00.000000Z"], "posted_by": ["Someone"],
+        "description": ["Description"], "image_url": [None], "is_event": is_event, "event_type": None, "event_date": None,
+        "event_time": None, "event_location": None, "is_food": "FALSE", "food_type": None
+    }
+
+def test_enqueue_normalizes_and_skips_known_links(store):
+    work_queue = WorkQueue(store)
+    assert work_queue.enqueue([link(1), "https://edstem.org/courses/1/discussion/1\n", "not a link"]) == 1
+    work_queue.complete([post_llm_dict(link(2))])
+    assert work_queue.enqueue([link(1), link(2), link(3)]) == 1
+    assert work_queue.counts()['pending'] == 2
+
+def test_claim_complete_and_recover(store):
+    work_queue = WorkQueue(store)
+    work_queue.enqueue([link(1), link(2), link(3)])
+
+    claimed = work_queue.claim(2)
+    assert len(claimed) == 2
+    assert work_queue.counts() == {"pending": 1, "in_flight": 2, "done": 0, "failed": 0}
+
+    work_queue.complete([post_llm_dict(claimed[0], is_event="TRUE")])
+    assert store.contains(claimed[0])
+
+    # A crash leaves the second link in flight, the next run resumes it
+    assert work_queue.recover() == 1
+    assert work_queue.counts() == {"pending": 2, "in_flight": 0, "done": 1, "failed": 0}
+
+def test_fail_backs_off_then_gives_up(store):
+    work_queue = WorkQueue(store, max_attempts=3, backoff_base=60)
+    work_queue.enqueue([link(1)])
+    work_queue.claim(1)
+
+    assert work_queue.fail(link(1), "timeout") == "pending"
+    row = store.connection.execute("SELECT attempts, next_attempt_at, last_error FROM link_queue").fetchone()
+    assert row['attempts'] == 1 and row['last_error'] == "timeout"
+    assert 30 <= row['next_attempt_at'] - time.time() <= 90
+    assert work_queue.claim(1) == []  # Not due yet
+
+    assert work_queue.fail(link(1)) == "pending"
+    assert work_queue.fail(link(1)) == "failed"
+    assert work_queue.counts()['failed'] == 1
+
+    assert work_queue.requeue_failed() == 1
+    assert work_queue.claim(1) == [link(1)]
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue
+from functions import create_driver, copy_session_cookies, dept_edstem_thread_scraper
+from instrumentation import metrics
+import time
+
+# Scrapes one thread with a driver borrowed from the pool, retrying with backoff on failure
+def scrape_thread_with_retries(driver_queue, thread_dict, incremental, max_retries, link_index):
+    for attempt in range(max_retries + 1):
+        driver = driver_queue.get()
+        try:
+            return dept_edstem_thread_scraper(driver, thread_dict, incremental=incremental, new_post_links_file=None, link_index=link_index)
+        except Exception as e:
+            print(f"Failed to scrape the {thread_dict['Department Name']} department's {thread_dict['Thread Name']} thread (attempt {attempt + 1}): {e}")
+        finally:
+            driver_queue.put(driver)
+
+        # Back off before retrying
+        if attempt < max_retries:
+            metrics.count("thread_scraper.retries")
+            time.sleep(2 ** attempt)
+
+    # Give up, the thread's high-water mark is unchanged so the next run picks it up again
+    return []
+
+# Scrapes every department thread concurrently through a bounded pool of headless drivers that share one login
+def scrape_threads_parallel(login_driver, thread_dict_list, max_workers=4, max_retries=2, incremental=True, headless=True, new_post_links_file='new_post_links.txt', link_index=None):
+    if not thread_dict_list:
+        return []
+
+    driver_queue = Queue()
+    drivers = []
+    new_post_links = []
+    seen_links = set()
+    try:
+        # Create the driver pool, copying the logged in session so Duo is only needed once
+        # (inside the try so drivers started before a failure are still quit)
+        print("Starting thread scraper drivers...")
+        for _ in range(min(max_workers, len(thread_dict_list))):
+            driver = create_driver(headless=headless)
+            drivers.append(driver)
+            copy_session_cookies(login_driver, driver)
+            driver_queue.put(driver)
+
+        # Scrape the threads concurrently and merge their links
+        with ThreadPoolExecutor(max_workers=len(drivers)) as executor:
+            futures = [executor.submit(scrape_thread_with_retries, driver_queue, thread_dict, incremental, max_retries, link_index) for thread_dict in thread_dict_list]
+
+            for future in as_completed(futures):
+                for href in future.result():
+                    if href not in seen_links:
+                        seen_links.add(href)
+                        new_post_links.append(href)
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+    # Write all links at once from this thread so nothing is interleaved
+    with open(new_post_links_file, 'a') as file:
+        for href in new_post_links:
+            file.write(f"{href}\n")
+
+    print(f"Finished adding {len(new_post_links)} post links from {len(thread_dict_list)} threads to database!")
+    return new_post_links
@@ -0,0 +1,154 @@
+from event_store import post_to_row, print_inserted_rows
+from link_index import normalize_edstem_link
+from instrumentation import metrics
+import random
+import time
+
+# States a link moves through
+link_states = ["pending", "in_flight", "done", "failed"]
+
+# Durable queue of post links kept in the event store's database, so queue state and stored posts change in one transaction
+class WorkQueue:
+    def __init__(self, store, link_index=None, max_attempts=5, backoff_base=60, backoff_max=6 * 60 * 60):
+        self.store = store
+        self.link_index = link_index  # Drops already-known links before they touch the database
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base  # Seconds before the first retry
+        self.backoff_max = backoff_max  # Longest wait between retries
+
+        with self.store.lock:
+            self.store.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS link_queue (
+                    post_link TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS link_queue_state ON link_queue (state, next_attempt_at);
+            """)
+            self.store.connection.commit()
+
+    # Adds links as pending (links already queued or already in the event store are skipped), returns how many were new
+    # Links are normalized to their canonical form, and with a link index duplicates are dropped without a database lookup
+    def enqueue(self, links):
+        new_links = []
+        for link in links:
+            try:
+                link = normalize_edstem_link(link)
+            except ValueError:
+                continue
+            if self.link_index is not None and not self.link_index.add(link):
+                metrics.count("links_skipped")
+                continue
+            new_links.append(link)
+
+        now = time.time()
+        added = 0
+        with self.store.lock:
+            with self.store.connection:
+                for link in new_links:
+                    if self.store.connection.execute("SELECT 1 FROM posts WHERE post_link = ?", (link,)).fetchone():
+                        continue
+                    cursor = self.store.connection.execute(
+                        "INSERT OR IGNORE INTO link_queue (post_link, state, updated_at) VALUES (?, 'pending', ?)",
+                        (link, now)
+                    )
+                    added += cursor.rowcount
+        return added
+
+    # Moves the links in a text file (e.g. new_post_links.txt) into the queue, then empties the file
+    def import_links_file(self, path):
+        try:
+            with open(path, 'r') as file:
+                links = file.readlines()
+        except FileNotFoundError:
+            return 0
+
+        # The file is only cleared after the links are committed to the queue
+        added = self.enqueue(links)
+        with open(path, 'w') as file:
+            pass
+
+        print(f"Queued {added} new links from {path}")
+        return added
+
+    # Puts links left in flight by a crashed or interrupted run back to pending
+    def recover(self):
+        with self.store.lock:
+            with self.store.connection:
+                cursor = self.store.connection.execute(
+                    "UPDATE link_queue SET state = 'pending', updated_at = ? WHERE state = 'in_flight'",
+                    (time.time(),)
+                )
+        if cursor.rowcount:
+            print(f"Resuming {cursor.rowcount} links left in flight by the last run")
+        return cursor.rowcount
+
+    # Atomically takes up to limit pending links that are due and marks them in flight
+    def claim(self, limit=1):
+        now = time.time()
+        with self.store.lock:
+            with self.store.connection:
+                links = [row[0] for row in self.store.connection.execute(
+                    "SELECT post_link FROM link_queue WHERE state = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at, post_link LIMIT ?",
+                    (now, limit)
+                )]
+                self.store.connection.executemany(
+                    "UPDATE link_queue SET state = 'in_flight', updated_at = ? WHERE post_link = ?",
+                    [(now, link) for link in links]
+                )
+        return links
+
+    # Stores analyzed posts and marks their links done in the same transaction
+    def complete(self, post_llm_dict_list):
+        rows = [post_to_row(post_llm_dict) for post_llm_dict in post_llm_dict_list]
+        now = time.time()
+        with metrics.timer("database.write"), self.store.lock:
+            with self.store.connection:
+                inserted_rows = self.store.insert_rows(rows)
+                self.store.connection.executemany(
+                    "UPDATE link_queue SET state = 'done', last_error = NULL, updated_at = ? WHERE post_link = ?",
+                    [(now, row['post_link']) for row in rows]
+                )
+
+        print_inserted_rows(inserted_rows)
+        return len(inserted_rows)
+
+    # Records a failed attempt, retrying later with jittered exponential backoff until max_attempts is reached
+    def fail(self, link, error=None):
+        now = time.time()
+        with self.store.lock:
+            with self.store.connection:
+                row = self.store.connection.execute("SELECT attempts FROM link_queue WHERE post_link = ?", (link,)).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                if attempts >= self.max_attempts:
+                    state, next_attempt_at = "failed", now
+                else:
+                    delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                    state, next_attempt_at = "pending", now + delay * random.uniform(0.5, 1.5)
+                self.store.connection.execute(
+                    """INSERT INTO link_queue (post_link, state, attempts, next_attempt_at, last_error, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(post_link) DO UPDATE SET state = excluded.state, attempts = excluded.attempts,
+                       next_attempt_at = excluded.next_attempt_at, last_error = excluded.last_error, updated_at = excluded.updated_at""",
+                    (link, state, attempts, next_attempt_at, str(error) if error is not None else None, now)
+                )
+        return state
+
+    # Gives failed links another round of attempts, starting again from the first backoff step
+    def requeue_failed(self):
+        with self.store.lock:
+            with self.store.connection:
+                cursor = self.store.connection.execute(
+                    "UPDATE link_queue SET state = 'pending', attempts = 0, next_attempt_at = 0, updated_at = ? WHERE state = 'failed'",
+                    (time.time(),)
+                )
+        print(f"Requeued {cursor.rowcount} failed links")
+        return cursor.rowcount
+
+    # Number of links in each state
+    def counts(self):
+        with self.store.lock:
+            counts = dict(self.store.connection.execute("SELECT state, COUNT(*) FROM link_queue GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in link_states}